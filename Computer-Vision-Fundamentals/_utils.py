@@ -1,130 +1,327 @@
+from itertools import islice
+
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 import numpy as np
 
-def summary(image):
-	if image.ndim == 2:
-		SUM = ('\n{0:>10s}: {1:>15.4f}').format('min', np.amin(image))
-		SUM += ('\n{0:>10s}: {1:>15.4f}').format('1st Quar', np.percentile(image, 25))
-		SUM += ('\n{0:>10s}: {1:>15.4f}').format('median', np.median(image))
-		SUM += ('\n{0:>10s}: {1:>15.4f}').format('mean', np.mean(image))
-		SUM += ('\n{0:>10s}: {1:>15.4f}').format('3rd Quar', np.percentile(image, 75))
-		SUM += ('\n{0:>10s}: {1:>15.4f}').format('max', np.amax(image))
-		SUM += ('\n{0:>10s}: {1:>15.4f}').format('sigma', np.std(image))
-	elif image.ndim == 3:
-		R = image[:,:,0]
-		G = image[:,:,1]
-		B = image[:,:,2]
-		SUM = ('{0:>%ss} {1:>%ss} {2:>%ss}' % (27, 15, 15)).format('R', 'G', 'B')
-		SUM += ('\n{0:>10s}: {1:>15.4f} {2:>15.4f} {3:>15.4f}').format('min', np.amin(R), np.amin(G), np.amin(B))
-		SUM += ('\n{0:>10s}: {1:>15.4f} {2:>15.4f} {3:>15.4f}').format('1st Quar', np.percentile(R, 25), np.percentile(G, 25), np.percentile(B, 25))
-		SUM += ('\n{0:>10s}: {1:>15.4f} {2:>15.4f} {3:>15.4f}').format('median', np.median(R), np.median(G), np.median(B))
-		SUM += ('\n{0:>10s}: {1:>15.4f} {2:>15.4f} {3:>15.4f}').format('mean', np.mean(R), np.mean(G), np.mean(B))
-		SUM += ('\n{0:>10s}: {1:>15.4f} {2:>15.4f} {3:>15.4f}').format('3rd Quar', np.percentile(R, 75), np.percentile(G, 75), np.percentile(B, 75))
-		SUM += ('\n{0:>10s}: {1:>15.4f} {2:>15.4f} {3:>15.4f}').format('max', np.amax(R), np.amax(G), np.amax(B))
-		SUM += ('\n{0:>10s}: {1:>15.4f} {2:>15.4f} {3:>15.4f}').format('sigma', np.std(R), np.std(G), np.std(B))
-	else:
+from profiling import profile, stage
+
+# Names of the notebooks star import, the imports they relied on included
+__all__ = [
+	'plt', 'gridspec', 'np', 'summary', 'channel_stats', 'histogram', 'histogram_batch', 'panel', 'panel_batch'
+]
+
+STATS = ['min', '1st Quar', 'median', 'mean', '3rd Quar', 'max', 'sigma']
+
+def _stats_exact(x):
+	# x is (samples, channels), every channel reduced at once
+	q1, median, q3 = np.percentile(x, [25, 50, 75], axis=0)
+	return {
+		'min': np.amin(x, axis=0),
+		'1st Quar': q1,
+		'median': median,
+		'mean': np.mean(x, axis=0),
+		'3rd Quar': q3,
+		'max': np.amax(x, axis=0),
+		'sigma': np.std(x, axis=0)
+	}
+
+def _stats_stream(blocks, sample, seed):
+	# Running extremes, Chan/Welford moments and a reservoir sample
+	rand = np.random.default_rng(seed)
+	n = 0
+	for block in blocks:
+		block = np.asarray(block, dtype=np.float64)
+		block = block.reshape(block.shape[0], -1)
+		nb = block.shape[0]
+		if not nb:
+			continue
+		mb = np.mean(block, axis=0)
+		M2b = np.sum((block - mb)**2, axis=0)
+		if not n:
+			vmin, vmax = np.amin(block, axis=0), np.amax(block, axis=0)
+			mean, M2 = mb, M2b
+			reservoir = np.empty((sample, block.shape[1]))
+		else:
+			vmin = np.minimum(vmin, np.amin(block, axis=0))
+			vmax = np.maximum(vmax, np.amax(block, axis=0))
+			delta = mb - mean
+			mean = mean + delta*nb/(n + nb)
+			M2 = M2 + M2b + delta**2*n*nb/(n + nb)
+		# Fill the reservoir, then replace with probability sample/index
+		fill = max(min(sample - n, nb), 0)
+		reservoir[n:n + fill] = block[:fill]
+		index = np.arange(n + fill, n + nb)
+		accept = rand.random(index.size) < sample/(index + 1)
+		reservoir[rand.integers(0, sample, accept.sum())] = block[fill:][accept]
+		n += nb
+	if not n:
+		raise ValueError('Invalid argument! There is no data..')
+	q1, median, q3 = np.percentile(reservoir[:min(n, sample)], [25, 50, 75], axis=0)
+	return {
+		'min': vmin,
+		'1st Quar': q1,
+		'median': median,
+		'mean': mean,
+		'3rd Quar': q3,
+		'max': vmax,
+		'sigma': (M2/n)**0.5
+	}
+
+def _blocks(x, chunk):
+	for i in range(0, x.shape[0], chunk):
+		yield x[i:i + chunk]
+
+@profile
+def channel_stats(image, approx=False, sample=2**16, chunk=2**20, seed=1234):
+	'''
+	Summary statistics of every channel, with all quantiles from a single
+	partitioning pass
+	image: Grayscale or HxWxC image, or an iterable of (n, C) pixel blocks
+	approx: Streaming mode over blocks of pixels, the quantiles are
+	        approximated from a reservoir sample
+	sample: Reservoir size
+	chunk: Block size in pixels for approx mode on arrays
+	Returns a dict of arrays with one value per channel
+	'''
+	if not hasattr(image, 'ndim'):
+		return _stats_stream(image, sample, seed)
+	if image.ndim not in (2, 3):
 		raise ValueError('Invalid argument! It is not an image..')
+	x = image.reshape(image.shape[0]*image.shape[1], -1)
+	if approx:
+		return _stats_stream(_blocks(x, chunk), sample, seed)
+	return _stats_exact(x)
+
+def summary(image, **kwargs):
+	STAT = channel_stats(image, **kwargs)
+	C = STAT['min'].size
+	if C == 1:
+		SUM = ''
+	else:
+		names = 'RGBA' if C <= 4 else [str(c) for c in range(C)]
+		SUM = ('{:>27s}' + ' {:>15s}'*(C - 1)).format(*names[:C])
+	for name in STATS:
+		SUM += ('\n{:>10s}:' + ' {:>15.4f}'*C).format(name, *STAT[name])
 	print(SUM)
 
-def histogram(image, **kwargs):
-	x, y = (3*(256 + 100), 256) if 'dims' not in kwargs else kwargs['dims']
-	dpi = 72 if 'dpi' not in kwargs else kwargs['dpi']
-	bins = 256 if 'bins' not in kwargs else kwargs['bins']
-	rw = 0.95 if 'rw' not in kwargs else kwargs['rw']
-	interval = [0, 255] if 'interval' not in kwargs else kwargs['interval']
+# Channel colors of the histogram
+HIST_COLORS = [(1, 0, 0.25, 0.5), (0.25, 1, 0, 0.5), (0, 0.25, 1, 0.5)]
 
-	fig = plt.figure(figsize=(x/dpi, y/dpi))
-	
-	gs1 = gridspec.GridSpec(1, 3)
+@profile
+def _histograms(image, bins, interval):
+	# Counts of every channel in one bincount, values out of interval ignored
+	x = image.reshape(image.shape[0]*image.shape[1], -1)
+	C = x.shape[1]
+	lo, hi = interval
+	index = np.floor((x - lo)*(bins/(hi - lo))).astype(np.int64)
+	# Last bin includes the upper limit, as in np.histogram
+	index[x == hi] = bins - 1
+	valid = (index >= 0) & (index < bins)
+	index += bins*np.arange(C)
+	counts = np.bincount(index[valid], minlength=bins*C).reshape(C, bins)
+	return counts, np.linspace(lo, hi, bins + 1)
+
+def _bars(counts, edges, rw):
+	# Bars of relative width rw centered in their bins, as ax.hist(rwidth=rw),
+	# drawn as one step outline with a zero step in every gap
+	width = np.diff(edges)
+	left = edges[:-1] + (1 - rw)*width/2
+	steps = np.stack([left, left + rw*width], axis=1).ravel()
+	values = np.zeros(counts.shape[:-1] + (2*counts.shape[-1] - 1,), dtype=counts.dtype)
+	values[..., ::2] = counts
+	return values, steps
+
+def _thumbnail(image, width, height):
+	# Strided view at about the display resolution
+	step = int(np.ceil(max(image.shape[0]/height, image.shape[1]/width, 1)))
+	return image[::step, ::step]
+
+@profile
+def _draw_histogram(fig, image, dims, bins, interval, rw):
+	x, y = dims
+	gs1 = gridspec.GridSpec(1, 3, figure=fig)
 	gs1.update(	left=0,
 				right=1,
 				bottom=0,
 				top=1,
 				wspace=0,
 				hspace=0)
-	ax1 = plt.subplot(gs1[:, 0])
+	ax1 = fig.add_subplot(gs1[:, 0])
 	ax1.axis('off')
-	ax2 = plt.subplot(gs1[:, 1:])
+	ax2 = fig.add_subplot(gs1[:, 1:])
 
-	img = image.copy()
+	img = _thumbnail(image, x/3, y)
+	counts, edges = _histograms(image.astype(np.uint8) if image.dtype == bool else image, bins, interval)
+	counts, edges = _bars(counts, edges, rw)
 
-	if img.ndim == 2:
+	if image.ndim == 2:
 		ax1.imshow(	img,
 					cmap='gray',
 					vmin=interval[0],
 					vmax=interval[1])
-		ax2.hist(	img.ravel(),
-					bins=bins,
-					range=interval,
-					rwidth=rw,
-					color='k')
-	elif img.ndim == 3:
+		ax2.stairs(counts[0], edges, fill=True, color='k')
+	else:
 		imgo = (img - interval[0])/(interval[1] - interval[0])
-		imgo[imgo < 0] = 0
-		imgo[imgo > 1] = 1
-
-		R = img[:,:,0]
-		G = img[:,:,1]
-		B = img[:,:,2]
+		imgo = np.clip(imgo, 0, 1)
 
 		ax1.imshow(imgo)
-		ax2.hist(	R.ravel(),
-					bins=bins,
-					range=interval,
-					rwidth=rw,
-					fc=(1, 0, 0.25, 0.5))
-		ax2.hist(	G.ravel(),
-					bins=bins,
-					range=interval,
-					rwidth=rw,
-					fc=(0.25, 1, 0, 0.5))
-		ax2.hist(	B.ravel(),
-					bins=bins,
-					range=interval,
-					rwidth=rw,
-					fc=(0, 0.25, 1, 0.5))
-	else:
+		for count, fc in zip(counts, HIST_COLORS):
+			ax2.stairs(count, edges, fill=True, fc=fc)
+
+@profile
+def histogram(image, **kwargs):
+	x, y = (3*(256 + 100), 256) if 'dims' not in kwargs else kwargs['dims']
+	dpi = 72 if 'dpi' not in kwargs else kwargs['dpi']
+	bins = 256 if 'bins' not in kwargs else kwargs['bins']
+	rw = 0.95 if 'rw' not in kwargs else kwargs['rw']
+	interval = [0, 255] if 'interval' not in kwargs else kwargs['interval']
+	save = None if 'save' not in kwargs else kwargs['save']
+
+	if image.ndim not in (2, 3):
 		raise ValueError('Invalid argument! It is not an image..')
-	plt.show()
+	if save:
+		# Non-interactive rendering straight to a PNG file
+		fig = Figure(figsize=(x/dpi, y/dpi), dpi=dpi)
+		FigureCanvasAgg(fig)
+		_draw_histogram(fig, image, (x, y), bins, interval, rw)
+		with stage('_utils.savefig'):
+			fig.savefig(save)
+		return
+	fig = plt.figure(figsize=(x/dpi, y/dpi))
+	_draw_histogram(fig, image, (x, y), bins, interval, rw)
+	with stage('_utils.show'):
+		plt.show()
 
-def panel(images, gspec, **kargs):
+@profile
+def histogram_batch(images, pattern, **kwargs):
+	'''
+	Render the histogram of every image to PNG files, reusing one figure
+	images: Iterable of images
+	pattern: File name pattern, i.e.: "output/histogram_{:04d}.png"
+	'''
+	x, y = (3*(256 + 100), 256) if 'dims' not in kwargs else kwargs['dims']
+	dpi = 72 if 'dpi' not in kwargs else kwargs['dpi']
+	bins = 256 if 'bins' not in kwargs else kwargs['bins']
+	rw = 0.95 if 'rw' not in kwargs else kwargs['rw']
+	interval = [0, 255] if 'interval' not in kwargs else kwargs['interval']
+
+	fig = Figure(figsize=(x/dpi, y/dpi), dpi=dpi)
+	FigureCanvasAgg(fig)
+	for i, image in enumerate(images):
+		if image.ndim not in (2, 3):
+			raise ValueError('Invalid argument! It is not an image..')
+		fig.clear()
+		_draw_histogram(fig, image, (x, y), bins, interval, rw)
+		with stage('_utils.savefig'):
+			fig.savefig(pattern.format(i))
+
+# Figures and axes grids reused by the non-interactive panels
+_PANELS = {}
+
+def _panel_axes(fig, gspec):
 	M, N = gspec
+	gs = gridspec.GridSpec(N, M, figure=fig)
+	gs.update(	left=0, right=1,
+                bottom=0, top=1,
+                wspace=0, hspace=0)
+	axes = []
+	for n in range(N):
+		for m in range(M):
+			ax = fig.add_subplot(gs[n, m])
+			ax.axis('off')
+			axes.append(ax)
+	return axes
 
-	x, y = (1024, 512) if 'dims' not in kargs else kargs['dims']
-	dpi = 72 if 'dpi' not in kargs else kargs['dpi']
+@profile
+def _draw_panel(axes, images, gspec, dims, **kargs):
+	M, N = gspec
+	x, y = dims
 	texts = [] if 'texts' not in kargs else kargs['texts']
 	tx, ty = (10, 10) if 'text_pos' not in kargs else kargs['text_pos']
 	tc = 'white' if 'text_color' not in kargs else kargs['text_color']
 	ts = 12 if 'text_size' not in kargs else kargs['text_size']
 	interval = [0, 255] if 'interval' not in kargs else kargs['interval']
 
+	images = iter(images)
+	blank = None
+	for i, ax in enumerate(axes):
+		for artist in list(ax.images) + list(ax.texts):
+			artist.remove()
+		image = next(images, None)
+		if image is not None:
+			# Downsample to the cell size, then normalize only what is drawn
+			image = _thumbnail(np.asarray(image), x/M, y/N)
+			image = np.clip((image - interval[0])/(interval[1] - interval[0]), 0, 1)
+			blank = np.zeros_like(image) if blank is None else blank
+		elif blank is not None:
+			image = blank
+		else:
+			continue
+		if image.ndim == 2:
+			ax.imshow(image, cmap='gray')
+		else:
+			ax.imshow(image)
+		try:
+			text = texts[i]
+		except:
+			text = ''
+		ax.text(	tx, ty, text,
+					color=tc, size=ts,
+					horizontalalignment='left',
+					verticalalignment='top')
+
+@profile
+def panel(images, gspec, **kargs):
+	'''
+	Grid of images, normalized and downsampled one at a time when drawn
+	images: Sequence, stack or generator of images
+	gspec: Grid (columns, rows)
+	save: Render to this PNG file, reusing the figure across calls
+	'''
+	M, N = gspec
+
+	# Figure options, the rest is forwarded to the drawing
+	x, y = kargs.pop('dims', (1024, 512))
+	dpi = kargs.pop('dpi', 72)
+	save = kargs.pop('save', None)
+
+	if save:
+		key = (M, N, x, y, dpi)
+		if key not in _PANELS:
+			fig = Figure(figsize=(x/dpi, y/dpi), dpi=dpi)
+			FigureCanvasAgg(fig)
+			_PANELS[key] = (fig, _panel_axes(fig, gspec))
+		fig, axes = _PANELS[key]
+		_draw_panel(axes, images, gspec, (x, y), **kargs)
+		with stage('_utils.savefig'):
+			fig.savefig(save)
+		return
 	fig = plt.figure(figsize=(x/dpi, y/dpi))
-	gs = gridspec.GridSpec(N, M)
-	gs.update(	left=0, right=1,
-                bottom=0, top=1,
-                wspace=0, hspace=0)
-	images = (images - interval[0])/(interval[1] - interval[0])
-	images[images < 0] = 0
-	images[images > 1] = 1
-	for n in range(N):
-		for m in range(M):
-			ax = plt.subplot(gs[n, m])
-			ax.axis('off')
-			try:
-				image = images[n*M + m]
-			except:
-				image = images[0]*0
-			if image.ndim == 2:
-				ax.imshow(image, cmap='gray')
-			else:
-				ax.imshow(image)
-			try:
-				text = texts[n*M + m]
-			except:
-				text = ''
-			ax.text(	tx, ty, text,
-						color=tc, size=ts,
-						horizontalalignment='left',
-						verticalalignment='top')
-	plt.show()
\ No newline at end of file
+	_draw_panel(_panel_axes(fig, gspec), images, gspec, (x, y), **kargs)
+	with stage('_utils.show'):
+		plt.show()
+
+@profile
+def panel_batch(images, gspec, pattern, **kargs):
+	'''
+	Contact sheets of a long sequence of images, one PNG file per page
+	images: Sequence, stack or generator of images
+	gspec: Grid (columns, rows) of every page
+	pattern: File name pattern, i.e.: "output/sheet_{:04d}.png"
+	texts: Labels of all images, split across the pages
+	'''
+	M, N = gspec
+	texts = [] if 'texts' not in kargs else list(kargs['texts'])
+	kargs.pop('save', None)
+	images = iter(images)
+	page = 0
+	while True:
+		cells = list(islice(images, M*N))
+		if not cells:
+			break
+		kargs['texts'] = texts[page*M*N:(page + 1)*M*N]
+		panel(cells, gspec, save=pattern.format(page), **kargs)
+		page += 1
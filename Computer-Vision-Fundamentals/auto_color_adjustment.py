@@ -0,0 +1,148 @@
+import numpy as np
+from numba import njit, jit, prange, types
+
+from color_models import FLOATS, _hsx, _rgb
+from kernels import DTYPES, array, register
+from profiling import profile
+
+METHODS = ('rgb', 'hsv', 'white balance')
+
+##############
+# Statistics #
+##############
+
+# Strided proxies are views, the full image is contiguous
+@register('row_statistics', [(array(T, 3, layout), types.float64, types.boolean) for T in DTYPES for layout in 'CA'],
+	lambda: (np.zeros((16, 16, 3), dtype=np.uint8), 1/255, False))
+@jit(nopython=True, parallel=True, cache=True)
+def _row_statistics(x, scale, hsv):
+	# Minimum, maximum and sum of every channel of every row, in RGB or HSV
+	N1, N2, C = x.shape
+	part = np.empty((N1, C, 3))
+	for n1 in prange(N1):
+		for c in range(C):
+			part[n1, c, 0] = np.inf
+			part[n1, c, 1] = -np.inf
+			part[n1, c, 2] = 0.0
+		for n2 in range(N2):
+			r, g, b = x[n1, n2, 0]*scale, x[n1, n2, 1]*scale, x[n1, n2, 2]*scale
+			if hsv:
+				r, g, b = _hsx(r, g, b, False)
+			for c, v in ((0, r), (1, g), (2, b)):
+				part[n1, c, 0] = min(part[n1, c, 0], v)
+				part[n1, c, 1] = max(part[n1, c, 1], v)
+				part[n1, c, 2] += v
+	return part
+
+def _scale(img):
+	return 1/np.iinfo(img.dtype).max if np.issubdtype(img.dtype, np.integer) else 1.0
+
+@profile
+def statistics(img, method='rgb', proxy=1):
+	'''
+	Channel statistics of an RGB image in a single reduction, (3, 3) with
+	the minimum, maximum and mean of every channel, in HSV for method='hsv'
+	img: Input image (N1, N2, 3), integer images are normalized to [0, 1]
+	proxy: Stride of the pixels sampled along each axis
+	'''
+	img = np.asarray(img)
+	if img.ndim != 3 or img.shape[2] != 3:
+		raise ValueError('Invalid argument! It is not a RGB image..')
+	if method not in METHODS:
+		raise ValueError(f'Invalid method! {method}')
+	x = img[::proxy, ::proxy]
+	if x.dtype.name not in DTYPES:
+		x = x.astype(np.float64)
+	part = _row_statistics(x, _scale(img), method == 'hsv')
+	stats = np.empty((3, 3))
+	stats[:, 0] = part[..., 0].min(axis=0)
+	stats[:, 1] = part[..., 1].max(axis=0)
+	stats[:, 2] = part[..., 2].sum(axis=0)/(x.shape[0]*x.shape[1])
+	return stats
+
+##############
+# Adjustment #
+##############
+
+@njit(cache=True)
+def _gray_world(v, lo, hi, corr, G):
+	offset = v + corr
+	# Values above the mean stretched up to 1, below it down to 0
+	up = (1 - G)*(offset - G)/(hi + corr - G) + G
+	down = 1 - (G*(G - offset)/(G - lo - corr) + 1 - G)
+	return down if down < G else up
+
+@register('adjust', [
+	(array(T, 3), types.float64, types.int64, array('float64', 2), array(D, 3))
+	for T in DTYPES for D in FLOATS
+], lambda: (np.zeros((16, 16, 3), dtype=np.uint8), 1/255, 0, np.ones((3, 3)), np.empty((16, 16, 3), dtype=np.float32)))
+@jit(nopython=True, parallel=True, cache=True)
+def _adjust(x, scale, method, stats, out):
+	N1, N2, C = x.shape
+	lo, hi, mu = stats[:, 0], stats[:, 1], stats[:, 2]
+	# Gray world, every mean moved to the green one
+	G = mu[1]
+	corr = G - mu
+	for n1 in prange(N1):
+		for n2 in range(N2):
+			r, g, b = x[n1, n2, 0]*scale, x[n1, n2, 1]*scale, x[n1, n2, 2]*scale
+			if method == 0:
+				r = (r - lo[0])/(hi[0] - lo[0])
+				g = (g - lo[1])/(hi[1] - lo[1])
+				b = (b - lo[2])/(hi[2] - lo[2])
+			elif method == 1:
+				# Stretch saturation and value, preserving hue
+				h, s, v = _hsx(r, g, b, False)
+				r, g, b = _rgb(h, (s - lo[1])/(hi[1] - lo[1]), (v - lo[2])/(hi[2] - lo[2]), False)
+			else:
+				r = _gray_world(r, lo[0], hi[0], corr[0], G)
+				g = _gray_world(g, lo[1], hi[1], corr[1], G)
+				b = _gray_world(b, lo[2], hi[2], corr[2], G)
+			out[n1, n2, 0], out[n1, n2, 1], out[n1, n2, 2] = r, g, b
+
+@profile
+def adjust(img, method, stats, out=None):
+	'''
+	Apply an automatic color adjustment in a single fused pass
+	img: Input image (N1, N2, 3)
+	method: 'rgb' (min-max stretch), 'hsv' (saturation and value stretch)
+	        or 'white balance' (gray world)
+	stats: Channel statistics from statistics(img, method)
+	out: Output array, float32 for integer inputs by default
+	'''
+	img = np.asarray(img)
+	if method not in METHODS:
+		raise ValueError(f'Invalid method! {method}')
+	if out is None:
+		out = np.empty(img.shape, dtype=img.dtype if np.issubdtype(img.dtype, np.floating) else np.float32)
+	scale = _scale(img)
+	# Contiguous and of a compiled dtype, as the kernel signatures
+	x = np.ascontiguousarray(img)
+	if x.dtype.name not in DTYPES:
+		x = x.astype(np.float64)
+	_adjust(x, scale, METHODS.index(method), np.ascontiguousarray(stats, dtype=np.float64), out)
+	return out
+
+def autoAdjust(img, method='rgb', proxy=1, out=None):
+	'''
+	Automatic color adjustment with statistics from a strided proxy
+	img: Input image (N1, N2, 3)
+	method: One of METHODS
+	proxy: Stride of the pixels sampled for the statistics
+	out: Output array
+	'''
+	return adjust(img, method, statistics(img, method, proxy), out)
+
+def autoAdjustStream(frames, method='rgb', proxy=4, smooth=0.9, out=None):
+	'''
+	Automatic color adjustment of a frame sequence, with the statistics
+	smoothed across frames by an exponential moving average
+	frames: Iterable of images (N1, N2, 3)
+	smooth: Weight of the previous statistics, 0 adjusts every frame alone
+	out: Output array reused by every frame, copy frames to keep them
+	'''
+	stats = None
+	for frame in frames:
+		current = statistics(frame, method, proxy)
+		stats = current if stats is None else smooth*stats + (1 - smooth)*current
+		yield adjust(frame, method, stats, out)
@@ -0,0 +1,327 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from functools import lru_cache
+
+import numba
+import numpy as np
+
+SIZES = (64, 256, 1024, 4096)
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '_data')
+
+############
+# Registry #
+############
+
+# name: (setup(rgb) -> (call, work), unit, largest size)
+CASES = {}
+
+def case(name, unit='Mpx', max_size=max(SIZES)):
+	'''
+	Register a benchmark case, a setup function of an (N, N, 3) RGB input
+	in [0, 1] returning the call to time and the number of pixels or
+	samples it processes
+	max_size: Largest N, for algorithms too slow or too large beyond it
+	'''
+	def wrap(f):
+		CASES[name] = (f, unit, max_size)
+		return f
+	return wrap
+
+def _gray(rgb):
+	return rgb.mean(axis=2)
+
+def _uint8(x):
+	return (x*255).astype(np.uint8)
+
+##########
+# Images #
+##########
+
+@case('DFT2D')
+def _dft(rgb):
+	from fourier_transform import DFT2D
+	x = _gray(rgb)
+	return lambda: DFT2D(x), x.size
+
+@case('DCT2D')
+def _dct(rgb):
+	from cosine_transform import DCT2D
+	x = _gray(rgb)
+	return lambda: DCT2D(x), x.size
+
+@case('convolve')
+def _convolve(rgb):
+	from convolution import convolve
+	x, h = _gray(rgb), np.ones((7, 7))/49
+	return lambda: convolve(x, h), x.size
+
+@case('sobel')
+def _sobel(rgb):
+	from sobel_operator import sobel
+	x = _gray(rgb)
+	return lambda: sobel(x), x.size
+
+@case('box filter')
+def _box_filter(rgb):
+	from box_filter import pbox_filter
+	x = _gray(rgb)
+	return lambda: pbox_filter(x, 7), x.size
+
+@case('adaptive threshold')
+def _adaptive_threshold(rgb):
+	from thresholding import adaptive_threshold
+	x = _uint8(_gray(rgb))
+	return lambda: adaptive_threshold(x), x.size
+
+@case('connect4')
+def _connect4(rgb):
+	from connectedComponent_analysis import connect4
+	x = _gray(rgb) > 0.5
+	return lambda: connect4(x), x.size
+
+@case('connect8')
+def _connect8(rgb):
+	from connectedComponent_analysis import connect8
+	x = _gray(rgb) > 0.5
+	return lambda: connect8(x), x.size
+
+@case('histogram equalization')
+def _eqHist(rgb):
+	from histogram_equalization import eqHist
+	x = _uint8(rgb)
+	return lambda: eqHist(x), x.shape[0]*x.shape[1]
+
+@case('sinogram', max_size=1024)
+def _sinogram(rgb):
+	from radon_transform import sinogram
+	x = _gray(rgb)
+	return lambda: sinogram(x, 180), x.size
+
+@case('back-projection', max_size=1024)
+def _back_projection(rgb):
+	from radon_transform import sinogram, sinogram_i
+	x = _gray(rgb)
+	S = sinogram(x, 180)
+	return lambda: sinogram_i(S), x.size
+
+@case('rgb2hsv')
+def _rgb2hsv(rgb):
+	from color_models import rgb2hsv
+	x = _uint8(rgb)
+	return lambda: rgb2hsv(x), x.shape[0]*x.shape[1]
+
+@case('rgb2YCbCr')
+def _rgb2ycbcr(rgb):
+	from color_models import rgb2model
+	x = _uint8(rgb)
+	return lambda: rgb2model(x, 'YCbCr'), x.shape[0]*x.shape[1]
+
+@case('blendStack', max_size=2048)
+def _blendStack(rgb):
+	from stacking import blendStack
+	# Noisy frames of the same scene
+	noise = np.random.RandomState(1234).normal(0, 0.05, (8, 1, 1, 1))
+	stack = _uint8(np.clip(rgb + noise, 0, 1))
+	return lambda: blendStack(stack), stack.shape[0]*stack.shape[1]*stack.shape[2]
+
+#####################
+# Distance measures #
+#####################
+
+# Formulas of dissimilarity_measures.ipynb, a point against N^2 points
+DISTANCES = {
+	'euclidean': lambda x, y: np.sum((x - y)**2, axis=1)**0.5,
+	'minkowski': lambda x, y: np.sum(np.absolute(x - y)**0.5, axis=1)**2,
+	'cosine': lambda x, y: 1 - np.sum(x*y, axis=1)/(np.sum(x**2)**0.5*np.sum(y**2, axis=1)**0.5)
+}
+
+def _distance(name):
+	def setup(rgb):
+		y = rgb[..., :2].reshape(-1, 2)*2 - 1
+		x = np.array([0.25, 0.25])
+		return lambda: DISTANCES[name](x, y), y.shape[0]
+	return setup
+
+for name in DISTANCES:
+	case(f'{name} distance', 'Msamples')(_distance(name))
+
+#########
+# Audio #
+#########
+
+@case('additive synthesis', 'Msamples', max_size=1024)
+def _additive_synthesis(rgb):
+	# Square wave of 32 harmonics as waveform_non-sinusoidal.ipynb, N^2 samples
+	fs = 44100
+	t = np.arange(rgb.shape[0]*rgb.shape[1])/fs
+	omega = 2*np.pi*110
+	K = np.array([range(32)]).T + 1.0
+	return lambda: 0.25*4/np.pi*np.sum(np.sin((2*K - 1)*omega*t)/(2*K - 1), axis=0), t.size
+
+@case('STFT', 'Msamples')
+def _stft(rgb):
+	from scipy import signal
+	# Frames of librosa.stft, used by the spectrogram helper
+	x = _gray(rgb).ravel() - 0.5
+	return lambda: signal.stft(x, nperseg=2048, noverlap=1536), x.size
+
+##########
+# Inputs #
+##########
+
+@lru_cache(maxsize=2)
+def _source(name):
+	import imageio
+	img = np.asarray(imageio.imread(os.path.join(DATA, name)))[..., :3]
+	return img/np.iinfo(img.dtype).max
+
+def _input(N, source='pimentos.png'):
+	'''
+	(N, N, 3) RGB input in [0, 1], a bundled image cropped or mirrored to
+	the size, or uniform noise for source=None
+	'''
+	if source is None:
+		return np.random.RandomState(1234).random_sample((N, N, 3))
+	img = _source(source)[:N, :N]
+	return np.pad(img, ((0, N - img.shape[0]), (0, N - img.shape[1]), (0, 0)), 'symmetric')
+
+#############
+# Benchmark #
+#############
+
+def _measure(call, repeat):
+	# First call outside, so compilation and caches are not timed
+	call()
+	best = np.inf
+	for _ in range(repeat):
+		t0 = time.perf_counter()
+		call()
+		best = min(best, time.perf_counter() - t0)
+	# Allocations traced by Python and numpy, not by numba internals
+	tracemalloc.start()
+	call()
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return best, peak
+
+def _commit():
+	try:
+		return subprocess.run(
+			['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+			capture_output=True, text=True, check=True
+		).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def run(cases=None, sizes=SIZES, threads=None, source='pimentos.png', repeat=3):
+	'''
+	Run the benchmark cases and return the results as a JSON serializable dict
+	cases: Case names, all of CASES by default
+	sizes: Square sizes N, images of N^2 pixels and signals of N^2 samples
+	threads: Numba thread counts for the scaling, 1 and all by default
+	source: Image in _data, or None for uniform noise
+	repeat: Timed calls, the best one is kept
+	'''
+	if threads is None:
+		threads = sorted({1, numba.config.NUMBA_NUM_THREADS})
+	results = []
+	default = numba.get_num_threads()
+	try:
+		for name in CASES if cases is None else cases:
+			setup, unit, max_size = CASES[name]
+			for N in sizes:
+				if N > max_size:
+					continue
+				call, work = setup(_input(N, source))
+				for n in threads:
+					numba.set_num_threads(n)
+					seconds, peak = _measure(call, repeat)
+					results.append({
+						'case': name, 'size': N, 'threads': n, 'seconds': seconds,
+						'throughput': work/seconds/1e6, 'unit': f'{unit}/s', 'peak_bytes': peak
+					})
+	finally:
+		numba.set_num_threads(default)
+	# Speed-up over the single thread run of every case and size
+	single = {(r['case'], r['size']): r['seconds'] for r in results if r['threads'] == 1}
+	for r in results:
+		key = (r['case'], r['size'])
+		r['scaling'] = single[key]/r['seconds'] if key in single else None
+	return {
+		'commit': _commit(),
+		'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+		'platform': platform.platform(),
+		'python': platform.python_version(),
+		'numpy': np.__version__,
+		'numba': numba.__version__,
+		'cpus': os.cpu_count(),
+		'source': source,
+		'results': results
+	}
+
+def report(data):
+	'''
+	Print the results of run()
+	'''
+	SUM = '{:>24s} {:>6s} {:>8s} {:>12s} {:>18s} {:>12s} {:>8s}'.format(
+		'case', 'size', 'threads', 'seconds', 'throughput', 'peak MiB', 'scaling')
+	for r in data['results']:
+		scaling = '' if r['scaling'] is None else '{:.2f}'.format(r['scaling'])
+		SUM += '\n{:>24s} {:>6d} {:>8d} {:>12.5f} {:>18s} {:>12.2f} {:>8s}'.format(
+			r['case'], r['size'], r['threads'], r['seconds'],
+			'{:.2f} {}'.format(r['throughput'], r['unit']), r['peak_bytes']/2**20, scaling)
+	print(SUM)
+
+def _results(x):
+	# Results of run() as they are, or loaded from a saved JSON file
+	if not isinstance(x, str):
+		return x
+	with open(x) as f:
+		return json.load(f)
+
+def compare(old, new, tolerance=0.1):
+	'''
+	Print the throughput ratio of two runs and return the regressions, the
+	entries slower than 1 - tolerance of the old throughput
+	old, new: Results of run() or paths of saved JSON files
+	'''
+	old, new = [_results(x) for x in (old, new)]
+	before = {(r['case'], r['size'], r['threads']): r['throughput'] for r in old['results']}
+	regressions = []
+	SUM = '{:>24s} {:>6s} {:>8s} {:>10s}'.format('case', 'size', 'threads', 'ratio')
+	for r in new['results']:
+		key = (r['case'], r['size'], r['threads'])
+		if key not in before:
+			continue
+		ratio = r['throughput']/before[key]
+		flag = ''
+		if ratio < 1 - tolerance:
+			regressions.append(dict(r, ratio=ratio))
+			flag = ' regression'
+		SUM += '\n{:>24s} {:>6d} {:>8d} {:>10.3f}{}'.format(*key, ratio, flag)
+	print(SUM)
+	return regressions
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Benchmark suite of the notebook algorithms')
+	parser.add_argument('--cases', nargs='+', choices=list(CASES), help='cases to run, all by default')
+	parser.add_argument('--sizes', nargs='+', type=int, default=SIZES, help='square sizes N')
+	parser.add_argument('--threads', nargs='+', type=int, help='numba thread counts')
+	parser.add_argument('--synthetic', action='store_true', help='uniform noise instead of _data images')
+	parser.add_argument('--repeat', type=int, default=3)
+	parser.add_argument('--output', help='save the results as JSON')
+	parser.add_argument('--compare', help='JSON results of a previous run')
+	args = parser.parse_args()
+	data = run(args.cases, args.sizes, args.threads, None if args.synthetic else 'pimentos.png', args.repeat)
+	report(data)
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(data, f, indent=1)
+	if args.compare:
+		compare(args.compare, data)
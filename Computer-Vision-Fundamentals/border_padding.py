@@ -0,0 +1,65 @@
+import numpy as np
+from numba import njit
+
+# Virtual border modes, named after np.pad
+BORDER = {
+	'constant': 0,
+	'edge': 1,
+	'wrap': 2,
+	'reflect': 3,
+	'symmetric': 4
+}
+
+def border_mode(border):
+	'''
+	Numeric code of a border mode, to be passed to the numba kernels
+	'''
+	if border not in BORDER:
+		raise ValueError(f'Invalid border! {border}')
+	return BORDER[border]
+
+@njit(cache=True)
+def resolve(i, n, mode):
+	'''
+	Index inside [0, n) for the position i of a virtually padded axis,
+	or -1 where a constant border must be used
+	'''
+	if 0 <= i < n:
+		return i
+	if mode == 0:
+		return -1
+	if mode == 1:
+		return 0 if i < 0 else n - 1
+	if mode == 2:
+		return i % n
+	if mode == 3:
+		if n == 1:
+			return 0
+		# Reflection without repeating the edge has period 2n - 2
+		i = i % (2*n - 2)
+		return i if i < n else 2*n - 2 - i
+	# Reflection repeating the edge has period 2n
+	i = i % (2*n)
+	return i if i < n else 2*n - 1 - i
+
+def border_index(i, n, border):
+	'''
+	Vectorized resolve over an array of positions, with -1 where a
+	constant border must be used
+	'''
+	i = np.asarray(i)
+	if border == 'constant':
+		return np.where((0 <= i) & (i < n), i, -1)
+	if border == 'edge':
+		return np.clip(i, 0, n - 1)
+	if border == 'wrap':
+		return i % n
+	if border == 'reflect':
+		if n == 1:
+			return np.zeros_like(i)
+		i = i % (2*n - 2)
+		return np.where(i < n, i, 2*n - 2 - i)
+	if border == 'symmetric':
+		i = i % (2*n)
+		return np.where(i < n, i, 2*n - 1 - i)
+	raise ValueError(f'Invalid border! {border}')
@@ -0,0 +1,176 @@
+import numpy as np
+from numba import njit, jit, prange, types
+
+from border_padding import border_mode
+from kernels import DTYPES, array, register
+from profiling import profile
+
+###########
+# Kernels #
+###########
+
+@njit(cache=True)
+def _prefix(cs, k, mode, cval):
+	'''
+	Sum of the first k samples of a virtually padded 1D signal, where cs is
+	the cumulative sum of the signal with a leading zero and k may be
+	negative or beyond the signal length
+	'''
+	n = cs.shape[0] - 1
+	if 0 <= k <= n:
+		return cs[k]
+	if mode == 0:
+		return k*cval if k < 0 else cs[n] + (k - n)*cval
+	if mode == 1:
+		return k*cs[1] if k < 0 else cs[n] + (k - n)*(cs[n] - cs[n - 1])
+	if mode == 2:
+		return (k//n)*cs[n] + cs[k % n]
+	if mode == 3:
+		if n == 1:
+			return k*cs[1]
+		# One period is x[0], ..., x[n - 1], x[n - 2], ..., x[1]
+		P = 2*n - 2
+		p = k % P
+		period = cs[n] + cs[n - 1] - cs[1]
+		partial = cs[p] if p <= n else cs[n] + cs[n - 1] - cs[P - p + 1]
+		return (k//P)*period + partial
+	# One period is x[0], ..., x[n - 1], x[n - 1], ..., x[0]
+	P = 2*n
+	p = k % P
+	partial = cs[p] if p <= n else 2*cs[n] - cs[P - p]
+	return (k//P)*2*cs[n] + partial
+
+def _sample(dtype):
+	return np.zeros((16, 16, 1), dtype=dtype), 1, 1, 0.0
+
+@register('box_rows', [(array(T, 3), types.int64, types.int64, types.float64) for T in DTYPES], lambda: _sample(np.uint8))
+@jit(nopython=True, parallel=True, cache=True)
+def _box_rows(M, r, mode, cval):
+	N1, N2, C = M.shape
+	output = np.empty((N1, N2, C))
+	for n1 in prange(N1):
+		cs = np.empty(N2 + 1)
+		for c in range(C):
+			# Running sum along the row
+			cs[0] = 0.0
+			for n2 in range(N2):
+				cs[n2 + 1] = cs[n2] + M[n1, n2, c]
+			for n2 in range(N2):
+				if r <= n2 < N2 - r:
+					output[n1, n2, c] = cs[n2 + r + 1] - cs[n2 - r]
+				else:
+					output[n1, n2, c] = _prefix(cs, n2 + r + 1, mode, cval) - _prefix(cs, n2 - r, mode, cval)
+	return output
+
+@register('box_cols', [(array('float64', 3), types.int64, types.int64, types.float64)], lambda: _sample(np.float64))
+@jit(nopython=True, parallel=True, cache=True)
+def _box_cols(M, r, mode, cval):
+	N1, N2, C = M.shape
+	output = np.empty((N1, N2, C))
+	for n2 in prange(N2):
+		cs = np.empty(N1 + 1)
+		for c in range(C):
+			# Running sum along the column
+			cs[0] = 0.0
+			for n1 in range(N1):
+				cs[n1 + 1] = cs[n1] + M[n1, n2, c]
+			for n1 in range(N1):
+				if r <= n1 < N1 - r:
+					output[n1, n2, c] = cs[n1 + r + 1] - cs[n1 - r]
+				else:
+					output[n1, n2, c] = _prefix(cs, n1 + r + 1, mode, cval) - _prefix(cs, n1 - r, mode, cval)
+	return output
+
+##############
+# Box filter #
+##############
+
+@profile
+def box_sum(M, r, border='edge', cval=0):
+	'''
+	Sum over the (2r + 1)^2 neighborhood of every pixel, O(1) per pixel
+	M: Input matrix or HxWxC image, all channels at once
+	border: np.pad mode resolved on the fly
+	cval: Border value for border='constant'
+	'''
+	M = np.asarray(M)
+	if M.ndim not in (2, 3):
+		raise ValueError('Invalid argument! It is not an image..')
+	mode = border_mode(border)
+	r = int(r)
+	# Contiguous and of a compiled dtype, as the kernel signatures
+	x = np.ascontiguousarray(M.reshape(*M.shape[:2], -1))
+	if x.dtype.name not in DTYPES:
+		x = x.astype(np.float64)
+	rows = _box_rows(x, r, mode, float(cval))
+	# Rows outside the image hold the row sum of a constant border
+	output = _box_cols(rows, r, mode, float(cval)*(2*r + 1))
+	return output.reshape(M.shape)
+
+def pbox_filter(M, r, border='edge', cval=0):
+	'''
+	Box filter of radius r, O(1) per pixel and without a padded copy
+	M: Input matrix or HxWxC image, all channels filtered at once
+	border: np.pad mode resolved on the fly
+	cval: Border value for border='constant'
+	'''
+	return box_sum(M, r, border, cval)/(2*r + 1)**2
+
+def pbox_filterRGB(img, r, border='edge', cval=0):
+	'''
+	Box filter of an image, keeping its dtype
+	'''
+	return pbox_filter(img, r, border, cval).astype(img.dtype)
+
+##################
+# Integral image #
+##################
+
+@profile
+def integral_image(M, dtype=None):
+	'''
+	Summed-area table S[i, j] = sum(M[:i, :j]), with a leading row and
+	column of zeros, shape (N1 + 1, N2 + 1) or (N1 + 1, N2 + 1, C)
+	M: Input matrix or HxWxC image
+	dtype: Accumulator, int64 for integer inputs and float64 otherwise
+	'''
+	M = np.asarray(M)
+	if dtype is None:
+		dtype = np.int64 if np.issubdtype(M.dtype, np.integer) else np.float64
+	S = np.zeros((M.shape[0] + 1, M.shape[1] + 1) + M.shape[2:], dtype=dtype)
+	np.cumsum(M, axis=0, dtype=dtype, out=S[1:, 1:])
+	np.cumsum(S[1:, 1:], axis=1, out=S[1:, 1:])
+	return S
+
+def local_sum(S, r):
+	'''
+	Sum and pixel count of the (2r + 1)^2 neighborhood of every pixel,
+	with the windows clipped to the image
+	S: Integral image from integral_image, (N1, N2, 1) counts for HxWxC
+	'''
+	N1, N2 = S.shape[0] - 1, S.shape[1] - 1
+	# Window limits in integral image coordinates
+	i0 = np.clip(np.arange(N1) - r, 0, N1)
+	i1 = np.clip(np.arange(N1) + r + 1, 0, N1)
+	j0 = np.clip(np.arange(N2) - r, 0, N2)
+	j1 = np.clip(np.arange(N2) + r + 1, 0, N2)
+	A = S[i1][:, j1] - S[i0][:, j1] - S[i1][:, j0] + S[i0][:, j0]
+	count = np.outer(i1 - i0, j1 - j0)
+	if S.ndim == 3:
+		# Same count for every channel
+		count = count[..., np.newaxis]
+	return A, count
+
+@profile
+def local_variance(M, r, border='edge', cval=0):
+	'''
+	Mean and variance over the (2r + 1)^2 neighborhood of every pixel
+	M: Input matrix or HxWxC image
+	border: np.pad mode resolved on the fly
+	'''
+	M = np.asarray(M, dtype=np.float64)
+	area = (2*r + 1)**2
+	mean = box_sum(M, r, border, cval)/area
+	var = box_sum(M*M, r, border, cval*cval)/area - mean*mean
+	# Cancellation may leave tiny negative values
+	return mean, np.maximum(var, 0, out=var)
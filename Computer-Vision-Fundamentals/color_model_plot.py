@@ -15,8 +15,61 @@ iBASE = np.array([
 base_pairs = [
     (0, 1), (1, 3), (3, 2), (2, 0), (4, 5), (5, 7), (7, 6), (6, 4), (0, 4), (1, 5), (2, 6), (3, 7)
 ]
+# Marker size range of the decimated point cloud
+MARKER_SIZE = (1, 6)
 
-def plotRGB(points):
+
+def encodeColors(colors):
+    '''
+    Hexadecimal plotly colors of RGB values in [0, 1], in one vectorized step
+    '''
+    c = np.clip((np.asarray(colors)*255).astype(np.int64), 0, 255)
+    return np.char.mod('#%06x', (c[..., 0] << 16) | (c[..., 1] << 8) | c[..., 2])
+
+
+def decimate(points, colors, budget=20000):
+    '''
+    Collapse duplicate colors, then bin the point cloud on the finest voxel
+    grid with at most budget occupied voxels
+    points: Model coordinates (N, 3)
+    colors: RGB values in [0, 1] (N, 3)
+    budget: Maximum number of points, None keeps every distinct color
+    Returns the mean point and color of every voxel and its pixel count
+    '''
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    colors = np.asarray(colors, dtype=np.float64).reshape(-1, 3)
+    # Points are a function of the color, so equal colors are equal points
+    c = np.clip((colors*255).astype(np.int64), 0, 255)
+    key = (c[:, 0] << 16) | (c[:, 1] << 8) | c[:, 2]
+    _, first, count = np.unique(key, return_index=True, return_counts=True)
+    points, colors = points[first], colors[first]
+    if budget is None or count.size <= budget:
+        return points, colors, count
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    span = np.where(hi > lo, hi - lo, 1)
+    grid = 256
+    while True:
+        cell = np.minimum(((points - lo)/span*grid).astype(np.int64), grid - 1)
+        voxel, index = np.unique((cell[:, 0]*grid + cell[:, 1])*grid + cell[:, 2], return_inverse=True)
+        if voxel.size <= budget or grid == 1:
+            break
+        # Occupied voxels scale roughly with the grid volume
+        grid = max(1, min(grid - 1, int(grid*(budget/voxel.size)**(1/3))))
+    weight = np.bincount(index, count)
+    mean = lambda x: np.stack([np.bincount(index, count*x[:, k]) for k in range(3)], axis=1)/weight[:, np.newaxis]
+    return mean(points), mean(colors), weight
+
+
+def markerSize(count):
+    '''
+    Marker sizes growing with the log of the pixel count of every point
+    '''
+    count = np.log(np.asarray(count, dtype=np.float64))
+    top = count.max()
+    return MARKER_SIZE[0] + (MARKER_SIZE[1] - MARKER_SIZE[0])*(count/top if top > 0 else 0*count)
+
+
+def plotRGB(points, budget=20000):
     ###############################
     #Identity model visualization #
     ###############################
@@ -57,17 +110,19 @@ def plotRGB(points):
     #############################
     # Point cloud visualization #
     #############################
+    # Decimate the point cloud
+    points, colors, count = decimate(points, points, budget)
     # Split channels
     R, G, B = points.T
     # Define point colors
-    color = [f'rgb({int(r*255)}, {int(g*255)}, {int(b*255)})' for r, g, b in points]
+    color = encodeColors(colors)
     MODEL = Scatter3d(
         x=R, y=G, z=B,
         name='RGB color model',
         mode='markers',
         line={'dash': 'dot'},
         marker={
-            'size': 1,
+            'size': markerSize(count),
             'color': color
         }
     )
@@ -99,7 +154,7 @@ def plotRGB(points):
     iplot(fig, filename='RGB_color', show_link=False)
 
 
-def plotXYZ(points, colors, m):
+def plotXYZ(points, colors, m, budget=20000):
     ###############################
     # Identity base visualization #
     ###############################
@@ -171,17 +226,19 @@ def plotXYZ(points, colors, m):
     #############################
     # Point cloud visualization #
     #############################
+    # Decimate the point cloud
+    points, colors, count = decimate(points, colors, budget)
     # Split channels
     X, Y, Z = points.T
     # Define point colors
-    color = [f'rgb({int(r*255)}, {int(g*255)}, {int(b*255)})' for r, g, b in colors]
+    color = encodeColors(colors)
     MODEL = Scatter3d(
         x=X, y=Y, z=Z,
         name='XYZ color model',
         mode='markers',
         line={'dash': 'dot'},
         marker={
-            'size': 1,
+            'size': markerSize(count),
             'color': color
         }
     )
@@ -213,7 +270,7 @@ def plotXYZ(points, colors, m):
     iplot(fig, filename='XYZ_color', show_link=False)
 
 
-def plotHSV(points, colors):
+def plotHSV(points, colors, budget=20000):
     ##########################
     # Identity visualization #
     ##########################
@@ -265,19 +322,21 @@ def plotHSV(points, colors):
     #############################
     # Point cloud visualization #
     #############################
+    # Decimate the point cloud
+    points, colors, count = decimate(points, colors, budget)
     # Split channels
     H, S, V = points.T
     X = S*V*np.sin(2*np.pi*H/360)
     Z = S*V*np.cos(2*np.pi*H/360)
     # Define point colors
-    color = [f'rgb({int(r*255)}, {int(g*255)}, {int(b*255)})' for r, g, b in colors]
+    color = encodeColors(colors)
     MODEL = Scatter3d(
         x=X, y=V, z=Z,
         name='HSV color model',
         mode='markers',
         line={'dash': 'dot'},
         marker={
-            'size': 1,
+            'size': markerSize(count),
             'color': color
         }
     )
@@ -309,7 +368,7 @@ def plotHSV(points, colors):
     iplot(fig, filename='HSV_color', show_link=False)
 
 
-def plotHSL(points, colors):
+def plotHSL(points, colors, budget=20000):
     ##########################
     # Identity visualization #
     ##########################
@@ -361,20 +420,22 @@ def plotHSL(points, colors):
     #############################
     # Point cloud visualization #
     #############################
+    # Decimate the point cloud
+    points, colors, count = decimate(points, colors, budget)
     # Split channels
     H, S, V = points.T
     V2 = np.where(V <= 0.5, V, 1 - V)*2
     X = S*V2*np.sin(2*np.pi*H/360)
     Z = S*V2*np.cos(2*np.pi*H/360)
     # Define point colors
-    color = [f'rgb({int(r*255)}, {int(g*255)}, {int(b*255)})' for r, g, b in colors]
+    color = encodeColors(colors)
     MODEL = Scatter3d(
         x=X, y=V, z=Z,
         name='HSL color model',
         mode='markers',
         line={'dash': 'dot'},
         marker={
-            'size': 1,
+            'size': markerSize(count),
             'color': color
         }
     )
@@ -0,0 +1,245 @@
+from functools import lru_cache
+
+import numpy as np
+from numba import njit, jit, prange, types
+
+from kernels import DTYPES, array, register
+from profiling import profile
+
+#################
+# Linear models #
+#################
+
+MATRICES = {
+	'XYZ': np.array([
+		[0.490, 0.310, 0.200],
+		[0.177, 0.813, 0.010],
+		[0.000, 0.010, 0.990]
+	]),
+	'YIQ': np.array([
+		[0.299, 0.587, 0.114],
+		[0.596, -0.275, -0.321],
+		[0.212, -0.523, 0.311]
+	]),
+	'YUV': np.array([
+		[0.299, 0.587, 0.114],
+		[-0.147, -0.289, 0.436],
+		[0.615, -0.515, -0.100]
+	]),
+	'YCbCr': np.array([
+		[ 0.299,  0.587,  0.114],
+		[-0.169, -0.331,  0.500],
+		[ 0.500, -0.419, -0.081]
+	])
+}
+
+MODELS = tuple(MATRICES) + ('HSV', 'HSL')
+
+@lru_cache(maxsize=32)
+def _matrix(model, inverse, dtype):
+	m = MATRICES[model]
+	if inverse:
+		m = np.linalg.inv(m)
+	# Transposed, so pixels (..., 3) multiply on the left without copies
+	m = np.ascontiguousarray(m.T, dtype=dtype)
+	m.setflags(write=False)
+	return m
+
+######################
+# Cylindrical models #
+######################
+
+@njit(cache=True)
+def _hsx(r, g, b, hsl):
+	# Hue in degrees [0, 360), ties resolved as the notebook, blue over green over red
+	M = max(r, g, b)
+	m = min(r, g, b)
+	d = M - m
+	if d == 0:
+		h = 0.0
+	elif M == b:
+		h = 60*(r - g)/d + 240
+	elif M == g:
+		h = 60*(b - r)/d + 120
+	else:
+		h = 60*(g - b)/d
+		if h < 0:
+			h += 360
+	if hsl:
+		l = (M + m)/2
+		if d == 0:
+			s = 0.0
+		elif l <= 0.5:
+			s = d/(M + m)
+		else:
+			s = d/(2 - (M + m))
+		return h, s, l
+	s = d/M if M != 0 else 0.0
+	return h, s, M
+
+@njit(cache=True)
+def _rgb(h, s, v, hsl):
+	if hsl:
+		c = (1 - abs(2*v - 1))*s
+		m = v - c/2
+	else:
+		c = v*s
+		m = v - c
+	k = (h % 360)/60
+	y = c*(1 - abs(k % 2 - 1))
+	if k < 1:
+		r, g, b = c, y, 0.0
+	elif k < 2:
+		r, g, b = y, c, 0.0
+	elif k < 3:
+		r, g, b = 0.0, c, y
+	elif k < 4:
+		r, g, b = 0.0, y, c
+	elif k < 5:
+		r, g, b = y, 0.0, c
+	else:
+		r, g, b = c, 0.0, y
+	return r + m, g + m, b + m
+
+# Output dtypes of the cylindrical models
+FLOATS = ('float32', 'float64')
+
+@register('rgb2hsx', [(array(T, 2), types.float64, types.boolean, array(D, 2)) for T in DTYPES for D in FLOATS],
+	lambda: (np.zeros((16, 3), dtype=np.uint8), 1/255, False, np.empty((16, 3), dtype=np.float32)))
+@jit(nopython=True, parallel=True, cache=True)
+def _rgb2hsx(x, scale, hsl, out):
+	for p in prange(x.shape[0]):
+		out[p, 0], out[p, 1], out[p, 2] = _hsx(x[p, 0]*scale, x[p, 1]*scale, x[p, 2]*scale, hsl)
+
+@register('hsx2rgb', [(array(T, 2), types.boolean, array(D, 2)) for T in FLOATS for D in FLOATS],
+	lambda: (np.zeros((16, 3), dtype=np.float32), False, np.empty((16, 3), dtype=np.float32)))
+@jit(nopython=True, parallel=True, cache=True)
+def _hsx2rgb(x, hsl, out):
+	for p in prange(x.shape[0]):
+		out[p, 0], out[p, 1], out[p, 2] = _rgb(x[p, 0], x[p, 1], x[p, 2], hsl)
+
+#################
+# Lookup tables #
+#################
+
+# Two tables at most, HSV and HSL, each of 192 MiB or more
+@lru_cache(maxsize=2)
+def LUT(model, dtype=np.float32):
+	'''
+	HSV or HSL lookup table of every uint8 RGB color, (256^3, 3) indexed
+	by (R << 16) | (G << 8) | B, 192 MiB in float32, the two most recent
+	tables are kept
+	'''
+	if model not in ('HSV', 'HSL'):
+		raise ValueError(f'Invalid model! {model}')
+	rgb = np.arange(256**3, dtype=np.uint32)
+	rgb = np.stack([rgb >> 16, (rgb >> 8) & 255, rgb & 255], axis=1).astype(np.uint8)
+	T = np.empty(rgb.shape, dtype=dtype)
+	_rgb2hsx(rgb, 1/255, model == 'HSL', T)
+	T.setflags(write=False)
+	return T
+
+def _lookup(img, model, out):
+	T = LUT(model, out.dtype.type)
+	index = (img[..., 0].astype(np.int32) << 16) | (img[..., 1].astype(np.int32) << 8) | img[..., 2]
+	np.take(T, index, axis=0, out=out)
+	return out
+
+###############
+# Conversions #
+###############
+
+def _check(img):
+	img = np.asarray(img)
+	if img.ndim < 1 or img.shape[-1] != 3:
+		raise ValueError('Invalid argument! It is not a 3-channel image..')
+	return img
+
+def _output(img, out, dtype):
+	if out is not None:
+		return out
+	if dtype is None:
+		dtype = img.dtype if np.issubdtype(img.dtype, np.floating) else np.float32
+	return np.empty(img.shape, dtype=dtype)
+
+def _pixels(x, dtypes=None):
+	# (..., 3) -> (N, 3), a view for contiguous arrays, a contiguous copy
+	# otherwise, as the kernel signatures
+	x = np.ascontiguousarray(x.reshape(-1, 3))
+	if dtypes is not None and x.dtype.name not in dtypes:
+		x = x.astype(np.float64)
+	return x
+
+@profile
+def rgb2model(img, model, out=None, dtype=None, lut=False):
+	'''
+	Convert RGB to XYZ, YIQ, YUV, YCbCr, HSV or HSL
+	img: Input image (..., 3), uint8 values are scaled by 1/255
+	model: One of MODELS, hue in degrees [0, 360)
+	out: Output array (..., 3)
+	dtype: Output dtype, float32 for integer inputs by default
+	lut: Use the precomputed HSV/HSL lookup table for uint8 inputs, linear
+	     models are a single matrix product either way
+	'''
+	img = _check(img)
+	if model not in MODELS:
+		raise ValueError(f'Invalid model! {model}')
+	out = _output(img, out, dtype)
+	if lut and img.dtype == np.uint8 and model not in MATRICES:
+		return _lookup(img, model, out)
+	scale = 1/255 if img.dtype == np.uint8 else 1.0
+	if model in MATRICES:
+		m = _matrix(model, False, out.dtype.type)
+		np.matmul(img, m*scale if scale != 1 else m, out=out)
+		return out
+	flat = _pixels(out)
+	_rgb2hsx(_pixels(img, DTYPES), scale, model == 'HSL', flat)
+	if not np.shares_memory(flat, out):
+		out[...] = flat.reshape(out.shape)
+	return out
+
+@profile
+def model2rgb(img, model, out=None, dtype=None):
+	'''
+	Convert XYZ, YIQ, YUV, YCbCr, HSV or HSL to RGB in [0, 1]
+	img: Input image (..., 3), hue in degrees
+	model: One of MODELS
+	out: Output array (..., 3)
+	dtype: Output dtype, float32 for integer inputs by default
+	'''
+	img = _check(img)
+	if model not in MODELS:
+		raise ValueError(f'Invalid model! {model}')
+	out = _output(img, out, dtype)
+	if model in MATRICES:
+		np.matmul(img, _matrix(model, True, out.dtype.type), out=out)
+		return out
+	flat = _pixels(out)
+	_hsx2rgb(_pixels(img, FLOATS), model == 'HSL', flat)
+	if not np.shares_memory(flat, out):
+		out[...] = flat.reshape(out.shape)
+	return out
+
+def rgb2hsv(img, out=None, dtype=None, lut=False):
+	'''
+	RGB to HSV in a single pass, hue in degrees [0, 360)
+	'''
+	return rgb2model(img, 'HSV', out, dtype, lut)
+
+def hsv2rgb(img, out=None, dtype=None):
+	'''
+	HSV to RGB in a single pass, hue in degrees
+	'''
+	return model2rgb(img, 'HSV', out, dtype)
+
+def rgb2hsl(img, out=None, dtype=None, lut=False):
+	'''
+	RGB to HSL in a single pass, hue in degrees [0, 360)
+	'''
+	return rgb2model(img, 'HSL', out, dtype, lut)
+
+def hsl2rgb(img, out=None, dtype=None):
+	'''
+	HSL to RGB in a single pass, hue in degrees
+	'''
+	return model2rgb(img, 'HSL', out, dtype)
@@ -0,0 +1,278 @@
+from functools import lru_cache
+
+import numpy as np
+from numba import njit, jit, prange, typeof
+
+from kernels import register as register_kernel
+from profiling import profile
+
+############
+# Registry #
+############
+
+# name: (per-pixel function f(A, B, a, b), operates on gamma linearized values)
+OPERATORS = {}
+
+def register(name, linear=False):
+	'''
+	Register a per-pixel operator f(A, B, a, b) -> O under a name
+	linear: Operate on gamma linearized values, as the blend modes
+	'''
+	def wrap(f):
+		OPERATORS[name] = (njit(f), linear)
+		return f
+	return wrap
+
+###############################
+# Alpha compositing operators #
+###############################
+
+@register('over')
+def _over(A, B, a, b):
+	return A*a + B*(1 - a)
+
+@register('atop')
+def _atop(A, B, a, b):
+	return A*b + B*(1 - a)
+
+@register('conjoint over')
+def _conjoint_over(A, B, a, b):
+	if a > b:
+		return A
+	# Without coverage on either side, B shows through
+	return A + B*(1 - a)/b if b > 0 else A + B
+
+@register('disjoint over')
+def _disjoint_over(A, B, a, b):
+	if a + b < 1:
+		return A + B
+	return A + B*(1 - a)/b if b > 0 else A + B
+
+@register('in')
+def _in(A, B, a, b):
+	return A*b
+
+@register('out')
+def _out(A, B, a, b):
+	return A*(1 - b)
+
+@register('xor')
+def _xor(A, B, a, b):
+	return A*(1 - b) + B*(1 - a)
+
+###############
+# Blend modes #
+###############
+
+@register('average', True)
+def _average(A, B, a, b):
+	return (A + B)/2
+
+@register('color burn', True)
+def _color_burn(A, B, a, b):
+	if A == 0:
+		return 0.0
+	return min(max(1 - (1 - B)/A, 0.0), 1.0)
+
+@register('difference', True)
+def _difference(A, B, a, b):
+	return abs(A - B)
+
+@register('division', True)
+def _division(A, B, a, b):
+	# Same inf and nan as the numpy division
+	return A/B if B != 0 else A*np.inf
+
+@register('exclusion', True)
+def _exclusion(A, B, a, b):
+	return A + B - 2*A*B
+
+@register('from', True)
+def _from(A, B, a, b):
+	return B - A
+
+@register('geometric', True)
+def _geometric(A, B, a, b):
+	return 2*A*B/(A + B) if A + B != 0 else 0.0
+
+@register('hypot', True)
+def _hypot(A, B, a, b):
+	return (A*A + B*B)**0.5
+
+@register('max', True)
+def _max(A, B, a, b):
+	return max(A, B)
+
+@register('min', True)
+def _min(A, B, a, b):
+	return min(A, B)
+
+@register('minus', True)
+def _minus(A, B, a, b):
+	return A - B
+
+@register('multiply', True)
+def _multiply(A, B, a, b):
+	return A*B
+
+@register('plus', True)
+def _plus(A, B, a, b):
+	return A + B
+
+@register('screen', True)
+def _screen(A, B, a, b):
+	return A + B - A*B
+
+@register('soft light', True)
+def _soft_light(A, B, a, b):
+	return B*(2*A + B*(1 - A*B))
+
+@register('hard light', True)
+def _hard_light(A, B, a, b):
+	return A*B if A < 0.5 else A + B - A*B
+
+@register('overlay', True)
+def _overlay(A, B, a, b):
+	return A*B if B < 0.5 else A + B - A*B
+
+#################
+# Lookup tables #
+#################
+
+@lru_cache(maxsize=16)
+def decode(dtype, gamma):
+	'''
+	Normalized and linearized value of every level of an integer dtype
+	'''
+	L = np.iinfo(dtype).max
+	T = (np.arange(L + 1)/L)**gamma
+	T.setflags(write=False)
+	return T
+
+@lru_cache(maxsize=16)
+def encode(dtype, gamma):
+	'''
+	Linear values half way between consecutive levels of an integer dtype,
+	so a search rounds to the nearest encoded level, and the first level
+	of every cell of a uniform linear grid, so the search stays short
+	'''
+	L = np.iinfo(dtype).max
+	T = ((np.arange(L) + 0.5)/L)**gamma
+	K = 4*L
+	start = np.append(np.searchsorted(T, np.arange(K + 1)/K), L)
+	for x in (T, start):
+		x.setflags(write=False)
+	return T, start
+
+###########
+# Kernels #
+###########
+
+@njit
+def _table(x, T, gamma):
+	# Integer levels are normalized and linearized by the table
+	return T[x]
+
+@njit
+def _power(x, T, gamma):
+	return x**gamma if gamma != 1 else x
+
+@njit
+def _encode(O, T, start):
+	# Levels with a midpoint below O, searched within the grid cell of O
+	L = T.shape[0]
+	if O >= 1:
+		return L
+	if not O > 0:
+		return 0
+	k = int(O*(start.shape[0] - 2))
+	lo, hi = start[k], start[k + 1]
+	while lo < hi:
+		mid = (lo + hi)//2
+		if T[mid] < O:
+			lo = mid + 1
+		else:
+			hi = mid
+	return lo
+
+@lru_cache(maxsize=None)
+def _kernel(f, loadA, loadB):
+	# One fused kernel per operator and input kinds, compiled on first use,
+	# numba cannot cache closures over their operator on disk
+
+	@jit(nopython=True, parallel=True)
+	def kernel(A, B, a, b, TA, TB, TO, start, gamma, out):
+		N1, N2, C = out.shape
+		for n1 in prange(N1):
+			for n2 in range(N2):
+				for c in range(C):
+					O = f(loadA(A[n1, n2, c], TA, gamma), loadB(B[n1, n2, c], TB, gamma), a[n1, n2], b[n1, n2])
+					if TO.shape[0]:
+						# Nearest integer level, out of range values saturate
+						out[n1, n2, c] = _encode(O, TO, start)
+					elif gamma != 1:
+						out[n1, n2, c] = O**(1/gamma)
+					else:
+						out[n1, n2, c] = O
+
+	return kernel
+
+###############
+# Compositing #
+###############
+
+_EMPTY = np.zeros(0)
+_EMPTY_INDEX = np.zeros(0, dtype=np.int64)
+
+def _alpha(x, shape):
+	# (N1, N2) or (N1, N2, 1) coverage, 1 everywhere by default
+	if x is None:
+		return np.broadcast_to(np.ones((1, 1)), shape)
+	x = np.asarray(x, dtype=np.float64)
+	return np.broadcast_to(x.reshape(x.shape[:2]), shape)
+
+@profile
+def composite(A, B, operator='over', a=None, b=None, gamma=2.2, out=None, tile=256):
+	'''
+	Composite two images with a named operator, one fused pass per tile
+	A, B: Input images (N1, N2, C), integer images are normalized to [0, 1]
+	operator: Name in OPERATORS
+	a, b: Alpha of A and B (N1, N2) or (N1, N2, 1), 1 by default
+	gamma: Linearization of the blend modes, O = f(A^gamma, B^gamma)^(1/gamma)
+	out: Output array, the dtype of A by default, integer outputs are
+	     rounded and saturated, with NaN as 0
+	tile: Rows per tile, inputs may be memory-mapped
+	'''
+	if operator not in OPERATORS:
+		raise ValueError(f'Invalid operator! {operator}')
+	A, B = np.asarray(A), np.asarray(B)
+	if A.shape != B.shape or A.ndim != 3:
+		raise ValueError('Invalid argument! Images must be (N1, N2, C) and match..')
+	if out is None:
+		out = np.empty(A.shape, dtype=A.dtype)
+	g = gamma if OPERATORS[operator][1] else 1
+	integer = lambda x: np.issubdtype(x.dtype, np.integer)
+	TA = decode(A.dtype.type, g) if integer(A) else _EMPTY
+	TB = decode(B.dtype.type, g) if integer(B) else _EMPTY
+	TO, start = encode(out.dtype.type, g) if integer(out) else (_EMPTY, _EMPTY_INDEX)
+	a, b = _alpha(a, A.shape[:2]), _alpha(b, A.shape[:2])
+	kernel = _kernel(OPERATORS[operator][0], _table if integer(A) else _power, _table if integer(B) else _power)
+	for m in range(0, A.shape[0], tile):
+		rows = slice(m, m + tile)
+		kernel(A[rows], B[rows], a[rows], b[rows], TA, TB, TO, start, float(g), out[rows])
+	return out
+
+def _sample(dtype):
+	# Arguments of the fused kernel as composite() passes them
+	A = np.zeros((16, 16, 3), dtype=dtype)
+	a = _alpha(None, A.shape[:2])
+	if np.issubdtype(A.dtype, np.integer):
+		T = decode(A.dtype.type, 1)
+		return (A, A, a, a, T, T, *encode(A.dtype.type, 1), 1.0, np.empty_like(A))
+	return (A, A, a, a, _EMPTY, _EMPTY, _EMPTY, _EMPTY_INDEX, 1.0, np.empty_like(A))
+
+# The default operator, compiled in process by warmup()
+register_kernel('over uint8', [tuple(typeof(x) for x in _sample(np.uint8))], lambda: _sample(np.uint8))(
+	_kernel(OPERATORS['over'][0], _table, _table))
+register_kernel('over float', [tuple(typeof(x) for x in _sample(T)) for T in (np.float32, np.float64)],
+	lambda: _sample(np.float32))(_kernel(OPERATORS['over'][0], _power, _power))
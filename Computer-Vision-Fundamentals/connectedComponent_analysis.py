@@ -0,0 +1,265 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from numba import njit, types
+
+from kernels import array, register
+from profiling import profile
+
+# Label dtypes, int64 only for masks of 2^31 pixels or more
+LABELS = ('int32', 'int64')
+
+##############
+# Union-find #
+##############
+
+@njit(cache=True)
+def _find(parent, i):
+	# Path halving
+	while parent[i] != i:
+		parent[i] = parent[parent[i]]
+		i = parent[i]
+	return i
+
+@njit(cache=True)
+def _union(parent, a, b):
+	a = _find(parent, a)
+	b = _find(parent, b)
+	# The smallest label is the earliest in raster order
+	if a < b:
+		parent[b] = a
+	elif b < a:
+		parent[a] = b
+	return min(a, b)
+
+############
+# Labeling #
+############
+
+@register('first_pass', [(array('bool', 2), array(T, 2), array(T, 1), types.int64) for T in LABELS],
+	lambda: (np.zeros((16, 16), dtype=bool), np.zeros((16, 16), dtype=np.int32), np.empty(146, dtype=np.int32), 8))
+@njit(cache=True)
+def _first_pass(mask, labels, parent, connectivity):
+	N1, N2 = mask.shape
+	count = 0
+	for m in range(N1):
+		for n in range(N2):
+			if mask[m, n] <= 0:
+				continue
+			# Already visited neighbors, up and left
+			label = 0
+			if m > 0 and labels[m - 1, n]:
+				label = labels[m - 1, n]
+			if n > 0 and labels[m, n - 1]:
+				label = _union(parent, label, labels[m, n - 1]) if label else labels[m, n - 1]
+			if connectivity == 8 and m > 0:
+				if n > 0 and labels[m - 1, n - 1]:
+					label = _union(parent, label, labels[m - 1, n - 1]) if label else labels[m - 1, n - 1]
+				if n < N2 - 1 and labels[m - 1, n + 1]:
+					label = _union(parent, label, labels[m - 1, n + 1]) if label else labels[m - 1, n + 1]
+			if not label:
+				count += 1
+				parent[count] = count
+				label = count
+			labels[m, n] = label
+	return count
+
+@register('second_pass', [(array(T, 2), array(T, 1), types.int64) for T in LABELS],
+	lambda: (np.zeros((16, 16), dtype=np.int32), np.zeros(1, dtype=np.int32), 0))
+@njit(cache=True)
+def _second_pass(labels, parent, count):
+	N1, N2 = labels.shape
+	# Consecutive final labels, in raster order of the first pixel
+	final = np.zeros(count + 1, dtype=labels.dtype)
+	subsets = 0
+	for i in range(1, count + 1):
+		root = _find(parent, i)
+		if root == i:
+			subsets += 1
+			final[i] = subsets
+		else:
+			final[i] = final[root]
+	area = np.zeros(subsets, dtype=np.int64)
+	bbox = np.empty((subsets, 4), dtype=np.int64)
+	bbox[:, :2] = np.iinfo(np.int64).max
+	bbox[:, 2:] = -1
+	moments = np.zeros((subsets, 2))
+	for m in range(N1):
+		for n in range(N2):
+			if not labels[m, n]:
+				continue
+			label = final[labels[m, n]]
+			labels[m, n] = label
+			k = label - 1
+			area[k] += 1
+			bbox[k, 0] = min(bbox[k, 0], m)
+			bbox[k, 1] = min(bbox[k, 1], n)
+			bbox[k, 2] = max(bbox[k, 2], m)
+			bbox[k, 3] = max(bbox[k, 3], n)
+			moments[k, 0] += m
+			moments[k, 1] += n
+	return subsets, area, bbox, moments
+
+@profile
+def label(mask, connectivity=8):
+	'''
+	Two-pass union-find connected-component labeling
+	mask: Input matrix, pixels > 0 are foreground
+	connectivity: 4 or 8
+	Returns the labels (0 for background, 1..n for components), the number
+	of components n and a dict of per-label statistics, indexed by label - 1:
+	area, bbox as (min row, min col, max row, max col) and centroid (row, col)
+	'''
+	mask = np.asarray(mask)
+	if mask.ndim != 2:
+		raise ValueError('Invalid argument! It is not a matrix..')
+	if connectivity not in (4, 8):
+		raise ValueError(f'Invalid connectivity! {connectivity}')
+	# Contiguous boolean foreground, as the kernel signatures
+	mask = np.ascontiguousarray(mask > 0)
+	labels = np.zeros(mask.shape, dtype=np.int32 if mask.size < 2**31 else np.int64)
+	# Provisional labels never exceed half of the pixels plus one per row
+	parent = np.empty(mask.size//2 + mask.shape[0] + 2, dtype=labels.dtype)
+	count = _first_pass(mask, labels, parent, int(connectivity))
+	subsets, area, bbox, moments = _second_pass(labels, parent, count)
+	stats = {
+		'area': area,
+		'bbox': bbox,
+		'centroid': moments/area[:, np.newaxis]
+	}
+	return labels, subsets, stats
+
+def connect4(grid):
+	'''
+	Define number of subsets given the 4-connected neighborhood
+	'''
+	labels, subsets, _ = label(grid, 4)
+	labels[labels == 0] = -1
+	return labels, subsets
+
+def connect8(grid):
+	'''
+	Define number of subsets given the 8-connected neighborhood
+	'''
+	labels, subsets, _ = label(grid, 8)
+	labels[labels == 0] = -1
+	return labels, subsets
+
+##################
+# Tiled labeling #
+##################
+
+def _label_tile(args):
+	mask, window, connectivity = args
+	if isinstance(mask, str):
+		# Each worker maps the input instead of receiving a copy
+		mask = np.load(mask, mmap_mode='r')[window]
+	labels, subsets, stats = label(np.asarray(mask), connectivity)
+	return labels, subsets, stats
+
+def _tiles(shape, tile):
+	N1, N2 = shape
+	for m in range(0, N1, tile):
+		for n in range(0, N2, tile):
+			yield (slice(m, min(m + tile, N1)), slice(n, min(n + tile, N2)))
+
+def _imap(func, jobs, workers):
+	# Bounded number of tiles in flight, so memory stays proportional to a tile
+	if not workers or workers < 2:
+		yield from map(func, jobs)
+		return
+	with ProcessPoolExecutor(workers) as pool:
+		pending = deque()
+		for job in jobs:
+			pending.append(pool.submit(func, job))
+			if len(pending) >= 2*workers:
+				yield pending.popleft().result()
+		while pending:
+			yield pending.popleft().result()
+
+@register('merge', [(array('int64', 1),)*3], lambda: (np.arange(4), np.array([1]), np.array([2])))
+@njit(cache=True)
+def _merge(parent, A, B):
+	for i in range(A.shape[0]):
+		_union(parent, A[i], B[i])
+
+@register('roots', [(array('int64', 1),)], lambda: (np.arange(4),))
+@njit(cache=True)
+def _roots(parent):
+	roots = np.empty_like(parent)
+	for i in range(parent.shape[0]):
+		roots[i] = _find(parent, i)
+	return roots
+
+def _seam_pairs(a, b, connectivity):
+	# Labels facing each other across a seam, a and b are adjacent lines
+	pairs = [(a, b)]
+	if connectivity == 8:
+		pairs += [(a[1:], b[:-1]), (a[:-1], b[1:])]
+	A = np.concatenate([u[(u > 0) & (v > 0)] for u, v in pairs])
+	B = np.concatenate([v[(u > 0) & (v > 0)] for u, v in pairs])
+	return A, B
+
+@profile
+def label_tiled(mask, tile=1024, connectivity=8, out=None, workers=None):
+	'''
+	Out-of-core connected-component labeling, tile by tile
+	mask: Input matrix, a memory-mapped array or the path of a .npy file,
+	      pixels > 0 are foreground
+	tile: Tile size
+	connectivity: 4 or 8
+	out: Output array or the path of a .npy file to be memory-mapped
+	workers: Number of processes labeling tiles in parallel
+	Returns the global labels, the number of components and the merged
+	statistics as in label()
+	'''
+	source = mask if isinstance(mask, str) else None
+	if source is not None:
+		mask = np.load(source, mmap_mode='r')
+	if mask.ndim != 2:
+		raise ValueError('Invalid argument! It is not a matrix..')
+	if out is None:
+		out = np.zeros(mask.shape, dtype=np.int64)
+	elif isinstance(out, str):
+		out = np.lib.format.open_memmap(out, mode='w+', dtype=np.int64, shape=mask.shape)
+	windows = list(_tiles(mask.shape, tile))
+	jobs = ((source if source else mask[w], w, connectivity) for w in windows)
+	# Label every tile independently, with globally unique labels
+	count = 0
+	area, bbox, moments = [np.zeros(0, dtype=np.int64)], [np.zeros((0, 4), dtype=np.int64)], [np.zeros((0, 2))]
+	for w, (labels, subsets, stats) in zip(windows, _imap(_label_tile, jobs, workers)):
+		origin = np.array([w[0].start, w[1].start])
+		out[w] = np.where(labels > 0, labels + count, 0)
+		area.append(stats['area'])
+		bbox.append(stats['bbox'] + np.tile(origin, 2))
+		moments.append((stats['centroid'] + origin)*stats['area'][:, np.newaxis])
+		count += subsets
+	area, bbox, moments = np.concatenate(area), np.concatenate(bbox), np.concatenate(moments)
+	# Global equivalence table from the labels along the tile seams
+	parent = np.arange(count + 1, dtype=np.int64)
+	N1, N2 = mask.shape
+	for m in range(tile, N1, tile):
+		_merge(parent, *_seam_pairs(np.asarray(out[m - 1]), np.asarray(out[m]), connectivity))
+	for n in range(tile, N2, tile):
+		_merge(parent, *_seam_pairs(np.asarray(out[:, n - 1]), np.asarray(out[:, n]), connectivity))
+	# Consecutive final labels, in order of the first tile touching them
+	unique, final = np.unique(_roots(parent), return_inverse=True)
+	subsets = unique.size - 1
+	for w in windows:
+		out[w] = final[out[w]]
+	# Merge the tile statistics of every component
+	k = final[1:] - 1
+	stats = {
+		'area': np.bincount(k, area, subsets).astype(np.int64),
+		'bbox': np.empty((subsets, 4), dtype=np.int64)
+	}
+	stats['bbox'][:, :2] = np.iinfo(np.int64).max
+	stats['bbox'][:, 2:] = -1
+	np.minimum.at(stats['bbox'][:, :2], k, bbox[:, :2])
+	np.maximum.at(stats['bbox'][:, 2:], k, bbox[:, 2:])
+	stats['centroid'] = np.stack([
+		np.bincount(k, moments[:, 0], subsets),
+		np.bincount(k, moments[:, 1], subsets)
+	], axis=1)/stats['area'][:, np.newaxis]
+	return out, subsets, stats
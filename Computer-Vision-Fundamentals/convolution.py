@@ -0,0 +1,252 @@
+import time
+
+import numpy as np
+from numba import jit, prange, types
+from scipy import signal
+
+from border_padding import border_mode, resolve
+from kernels import DTYPES, array, register
+from profiling import profile
+
+###########
+# Kernels #
+###########
+
+# Input of every compiled dtype, taps, border mode and value
+MATRIX = [(array(T, 2), array('float64', 2), types.int64, types.float64) for T in DTYPES]
+VECTOR = [(array(T, 2), array('float64', 1), types.int64, types.float64) for T in DTYPES]
+
+def _sample(ndim):
+	return np.zeros((16, 16)), np.ones((3,)*ndim), 0, 0.0
+
+@register('convolve_direct', MATRIX, lambda: _sample(2))
+@jit(nopython=True, parallel=True, cache=True)
+def convolve_direct(x, h, mode=0, cval=0.0):
+	xh, xw = x.shape
+	hh, hw = h.shape
+	# Kernel radius
+	rh, rw = hh//2, hw//2
+	# Init output
+	output = np.zeros(x.shape)
+	for n1 in prange(xh):
+		inner = rh <= n1 < xh - rh
+		for n2 in range(xw):
+			value = 0.0
+			if inner and rw <= n2 < xw - rw:
+				for k1 in range(hh):
+					for k2 in range(hw):
+						value += h[k1, k2]*x[n1 + k1 - rh, n2 + k2 - rw]
+			else:
+				# Resolve the virtual border on the fly
+				for k1 in range(hh):
+					i = resolve(n1 + k1 - rh, xh, mode)
+					for k2 in range(hw):
+						j = resolve(n2 + k2 - rw, xw, mode)
+						if i < 0 or j < 0:
+							value += h[k1, k2]*cval
+						else:
+							value += h[k1, k2]*x[i, j]
+			output[n1, n2] = value
+	return output
+
+@register('convolve_rows', VECTOR, lambda: _sample(1))
+@jit(nopython=True, parallel=True, cache=True)
+def _convolve_rows(x, h, mode, cval):
+	xh, xw = x.shape
+	hw = h.shape[0]
+	rw = hw//2
+	output = np.zeros(x.shape)
+	for n1 in prange(xh):
+		for n2 in range(xw):
+			value = 0.0
+			if rw <= n2 < xw - rw:
+				for k2 in range(hw):
+					value += h[k2]*x[n1, n2 + k2 - rw]
+			else:
+				for k2 in range(hw):
+					j = resolve(n2 + k2 - rw, xw, mode)
+					value += h[k2]*(cval if j < 0 else x[n1, j])
+			output[n1, n2] = value
+	return output
+
+# Second pass, over the float64 output of the rows
+@register('convolve_cols', VECTOR[1:2], lambda: _sample(1))
+@jit(nopython=True, parallel=True, cache=True)
+def _convolve_cols(x, h, mode, cval):
+	xh, xw = x.shape
+	hh = h.shape[0]
+	rh = hh//2
+	output = np.zeros(x.shape)
+	for n1 in prange(xh):
+		inner = rh <= n1 < xh - rh
+		for n2 in range(xw):
+			value = 0.0
+			if inner:
+				for k1 in range(hh):
+					value += h[k1]*x[n1 + k1 - rh, n2]
+			else:
+				for k1 in range(hh):
+					i = resolve(n1 + k1 - rh, xh, mode)
+					value += h[k1]*(cval if i < 0 else x[i, n2])
+			output[n1, n2] = value
+	return output
+
+def convolve_separable(x, col, row, mode=0, cval=0.0):
+	'''
+	Convolution by a rank-1 kernel h = col*row as two 1D passes
+	x: Input matrix
+	col, row: 1D factors of the kernel
+	'''
+	# Rows outside the image hold the row pass of a constant border
+	return _convolve_cols(_convolve_rows(x, row, mode, cval), col, mode, cval*row.sum())
+
+def convolve_fft(x, h, border=None, cval=0.0):
+	'''
+	Convolution through FFTs, same output layout as convolve_direct
+	x: Input matrix
+	h: Kernel matrix
+	border: np.pad mode, the FFT needs a buffer padded by the kernel radius
+	'''
+	xh, xw = x.shape
+	hh, hw = h.shape
+	rh, rw = hh//2, hw//2
+	# The kernels above are not flipped, so flip it back for fftconvolve
+	h = h[::-1, ::-1]
+	if border is not None:
+		pad = ((rh, hh - 1 - rh), (rw, hw - 1 - rw))
+		kwargs = {'constant_values': cval} if border == 'constant' else {}
+		return signal.fftconvolve(np.pad(x, pad, border, **kwargs), h, mode='valid')
+	output = np.zeros(x.shape)
+	if xh - 2*rh <= 0 or xw - 2*rw <= 0:
+		return output
+	valid = signal.fftconvolve(x, h, mode='valid')
+	output[rh:xh-rh, rw:xw-rw] = valid[:xh-2*rh, :xw-2*rw]
+	return output
+
+######################
+# Strategy selection #
+######################
+
+# Kernel taps from which FFT beats direct summation, set by tune()
+CROSSOVER = None
+
+# Crossover used until tune() runs, measured on a 256x256 input
+DEFAULT_CROSSOVER = 49
+
+def separable(h, tol=1e-10):
+	'''
+	Rank-1 factorization of a kernel via SVD
+	h: Kernel matrix
+	tol: Relative tolerance for the second singular value
+	Returns the (col, row) factors or None
+	'''
+	U, s, Vt = np.linalg.svd(h)
+	if s[0] == 0 or (s.size > 1 and s[1] > tol*s[0]):
+		return None
+	return U[:, 0]*s[0]**0.5, Vt[0]*s[0]**0.5
+
+def _time(f, *args, repeat=3):
+	best = np.inf
+	for _ in range(repeat):
+		t0 = time.perf_counter()
+		f(*args)
+		best = min(best, time.perf_counter() - t0)
+	return best
+
+def tune(shape=(256, 256), sizes=(3, 5, 7, 9, 11, 15, 21, 31, 45, 63), repeat=3):
+	'''
+	Micro-benchmark direct against FFT convolution on non-separable kernels
+	and store the crossover, in kernel taps, for method='auto', a few
+	seconds to call once at setup
+	shape: Size of the synthetic input
+	sizes: Kernel sizes to try, in increasing order
+	'''
+	global CROSSOVER
+	rand = np.random.RandomState(1234)
+	x = rand.random_sample(shape)
+	# Warm up the JIT before any measurement
+	convolve_direct(x[:8, :8].copy(), rand.random_sample((3, 3)), 0, 0.0)
+	CROSSOVER = np.inf
+	for k in sizes:
+		h = rand.random_sample((k, k))
+		if _time(convolve_fft, x, h, repeat=repeat) < _time(convolve_direct, x, h, 0, 0.0, repeat=repeat):
+			CROSSOVER = k*k
+			break
+	return CROSSOVER
+
+def strategy(h):
+	'''
+	Convolution method chosen by method='auto' for the kernel h, with
+	DEFAULT_CROSSOVER unless tune() ran
+	'''
+	if separable(h) is not None:
+		return 'separable'
+	crossover = DEFAULT_CROSSOVER if CROSSOVER is None else CROSSOVER
+	return 'fft' if h.size >= crossover else 'direct'
+
+def _zero_border(output, rh, rw):
+	# Layout of the notebook kernel, no output inside the kernel radius
+	output[:rh] = 0
+	output[output.shape[0] - rh:] = 0
+	output[:, :rw] = 0
+	output[:, output.shape[1] - rw:] = 0
+	return output
+
+@profile
+def convolve(x, h, method='auto', border=None, cval=0.0):
+	'''
+	2D convolution without kernel flip, as the notebook numba kernel
+	x: Input matrix or HxWxC image
+	h: Kernel matrix
+	method: 'auto', 'direct', 'separable' or 'fft'
+	border: np.pad mode resolved on the fly, or None for the notebook
+	        layout where the borders inside the kernel radius are zero
+	cval: Border value for border='constant'
+	'''
+	x = np.asarray(x)
+	if x.dtype.name not in DTYPES:
+		x = x.astype(np.float64)
+	h = np.ascontiguousarray(h, dtype=np.float64)
+	cval = float(cval)
+	if x.ndim == 3:
+		output = np.empty(x.shape)
+		for c in range(x.shape[2]):
+			output[..., c] = convolve(x[..., c], h, method, border, cval)
+		return output
+	if x.ndim != 2 or h.ndim != 2:
+		raise ValueError('Invalid argument! It is not a matrix..')
+	# Channels and views as the contiguous matrices of the kernel signatures
+	x = np.ascontiguousarray(x)
+	if method == 'auto':
+		method = strategy(h)
+	if method == 'fft':
+		return convolve_fft(x.astype(np.float64, copy=False), h, border, cval)
+	mode = border_mode('constant' if border is None else border)
+	if method == 'direct':
+		output = convolve_direct(x, h, mode, cval)
+	elif method == 'separable':
+		factors = separable(h)
+		if factors is None:
+			raise ValueError('Invalid argument! The kernel is not separable..')
+		output = convolve_separable(x, *factors, mode, cval)
+	else:
+		raise ValueError(f'Invalid method! {method}')
+	if border is None:
+		return _zero_border(output, h.shape[0]//2, h.shape[1]//2)
+	return output
+
+@profile
+def xcorrelate(x, h, method='auto', border=None, cval=0.0):
+	'''
+	2D cross correlation as the notebook numba kernel, a convolution by
+	the flipped kernel with the same arguments as convolve
+	'''
+	h = np.asarray(h, dtype=np.float64)
+	if h.ndim != 2:
+		raise ValueError('Invalid argument! It is not a matrix..')
+	# A zero tap after even sizes keeps the notebook alignment once flipped
+	h = np.pad(h, ((0, 1 - h.shape[0] % 2), (0, 1 - h.shape[1] % 2)))
+	return convolve(x, h[::-1, ::-1], method, border, cval)
+
+# The correlation runs the direct kernel over the flipped taps
+register('xcorrelate', MATRIX, lambda: _sample(2))(convolve_direct)
@@ -0,0 +1,112 @@
+from functools import lru_cache
+
+import numpy as np
+
+from profiling import profile
+
+##########################
+# Discrete 2D transforms #
+##########################
+
+@profile
+def DFT2D(x, shift=True, real=False):
+	'''
+	Discrete space fourier transform
+	x: Input matrix or stack of matrices (..., N1, N2)
+	shift: Move the zero frequency to the center
+	real: Return only the half spectrum of a real input
+	'''
+	x = np.asarray(x)
+	if x.ndim < 2:
+		raise ValueError('Invalid argument! It is not a matrix..')
+	if real:
+		X = np.fft.rfft2(x)
+		# Half spectrum is only centered along the first axis
+		axes = (-2,)
+	else:
+		X = np.fft.fft2(x)
+		axes = (-2, -1)
+	if shift:
+		X = np.fft.fftshift(X, axes=axes)
+	return X
+
+@profile
+def iDFT2D(X, shift=True, real=False, shape=None):
+	'''
+	Inverse discrete space fourier transform
+	X: Complex matrix or stack of complex matrices (..., N1, N2)
+	shift: The zero frequency is at the center
+	real: X is a half spectrum from DFT2D(..., real=True)
+	shape: Output shape (N1, N2), needed for odd N2 on half spectra
+	'''
+	X = np.asarray(X)
+	if X.ndim < 2:
+		raise ValueError('Invalid argument! It is not a matrix..')
+	if real:
+		if shift:
+			X = np.fft.ifftshift(X, axes=(-2,))
+		return np.abs(np.fft.irfft2(X, s=shape))
+	if shift:
+		X = np.fft.ifftshift(X, axes=(-2, -1))
+	return np.abs(np.fft.ifft2(X, s=shape))
+
+##############################
+# Frequency-domain filtering #
+##############################
+
+def gaussian(u, v, sigma=0.2):
+	'''
+	Gaussian transfer function
+	u, v: Normalized frequency coordinates
+	sigma: Standard deviation
+	'''
+	return 1/(2*np.pi*sigma**2)*np.exp(-(u**2 + v**2)/(2*sigma**2))
+
+TRANSFER = {
+	'gaussian': gaussian
+}
+
+@lru_cache(maxsize=64)
+def _transfer(kind, shape, shift, real, params):
+	N1, N2 = shape
+	# Centered frequency grid, normalized by the largest dimension
+	u = (np.arange(N1) - N1//2)/max(N1, N2)
+	v = (np.arange(N2) - N2//2)/max(N1, N2)
+	u, v = np.meshgrid(u, v, indexing='ij')
+	f = TRANSFER[kind] if isinstance(kind, str) else kind
+	H = np.asarray(f(u, v, **dict(params)), dtype=np.float64)
+	if real:
+		# Half spectrum keeps the non-negative frequencies of the last axis
+		H = np.fft.ifftshift(H, axes=(-1,))[:, :N2//2 + 1]
+	if not shift:
+		H = np.fft.ifftshift(H, axes=(-2,) if real else (-2, -1))
+	H = np.ascontiguousarray(H)
+	# The cache hands out the same array to every caller
+	H.setflags(write=False)
+	return H
+
+def transfer(kind, shape, shift=True, real=False, **params):
+	'''
+	Cached transfer function for a given spectrum shape
+	kind: Name in TRANSFER or a function f(u, v, **params)
+	shape: Spatial shape (N1, N2)
+	shift: Zero frequency at the center, as in DFT2D
+	real: Half spectrum layout, as in DFT2D(..., real=True)
+	'''
+	shape = tuple(int(n) for n in shape[-2:])
+	return _transfer(kind, shape, shift, real, tuple(sorted(params.items())))
+
+@profile
+def filterDFT2D(x, kind='gaussian', **params):
+	'''
+	Filter a matrix or a stack of same-shaped matrices in frequency domain
+	x: Input matrix or stack of matrices (..., N1, N2)
+	kind: Name in TRANSFER or a function f(u, v, **params)
+	'''
+	x = np.asarray(x)
+	real = not np.iscomplexobj(x)
+	shape = x.shape[-2:]
+	# Unshifted layout avoids rolling the spectrum of every frame
+	H = transfer(kind, shape, shift=False, real=real, **params)
+	X = DFT2D(x, shift=False, real=real)
+	return iDFT2D(X*H, shift=False, real=real, shape=shape)
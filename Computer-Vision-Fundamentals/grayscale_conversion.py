@@ -0,0 +1,143 @@
+from functools import lru_cache
+
+import numpy as np
+from numba import jit, prange, types
+
+from kernels import array, register
+from profiling import profile
+
+METHODS = (
+	'arithmetic', 'geometric', 'harmonic', 'minimum', 'maximum',
+	'lightness', 'median', 'luminosity'
+)
+
+# Rec.709 luminosity weights
+LUMINOSITY = (0.2126, 0.7152, 0.0722)
+
+# Fractional bits of the fixed-point weights, enough to keep four decimal
+# weights exact on uint16, and of the logarithms
+BITS = 32
+LOG_BITS = 12
+
+#################
+# Lookup tables #
+#################
+
+@lru_cache(maxsize=4)
+def _log_tables(levels):
+	# Fixed-point log of every level and the cube root of exp of their sums
+	LOG = np.zeros(levels, dtype=np.int64)
+	LOG[1:] = np.rint(np.log(np.arange(1, levels))*2**LOG_BITS)
+	EXP = np.floor(np.exp(np.arange(3*LOG[-1] + 1)/(3*2**LOG_BITS))).astype(np.int64)
+	for T in (LOG, EXP):
+		T.setflags(write=False)
+	return LOG, EXP
+
+def _fixed(weights):
+	# Weights scaled to 2^BITS and rounded up, so truncation never falls
+	# one level short on exact sums
+	w = np.asarray(weights, dtype=np.float64)
+	return np.ceil(w/w.sum()*2**BITS).astype(np.int64)
+
+###########
+# Kernels #
+###########
+
+# Integer inputs of the fixed-point kernel
+INTEGERS = ('uint8', 'uint16')
+
+@register('grayscale', [
+	(array(T, 2), types.int64, array('int64', 1)) + (array('int64', 1, readonly=True),)*2 + (array(T, 1),)
+	for T in INTEGERS
+], lambda: (np.zeros((16, 3), dtype=np.uint8), 7, _fixed(LUMINOSITY), *_log_tables(256), np.empty(16, dtype=np.uint8)))
+@jit(nopython=True, parallel=True, cache=True)
+def _grayscale(x, method, W, LOG, EXP, out):
+	for p in prange(x.shape[0]):
+		r, g, b = np.int64(x[p, 0]), np.int64(x[p, 1]), np.int64(x[p, 2])
+		if method == 0:
+			v = (r + g + b)//3
+		elif method == 1:
+			P = r*g*b
+			if P == 0:
+				v = 0
+			else:
+				# Estimate from the log tables, then exact integer cube root
+				v = EXP[LOG[r] + LOG[g] + LOG[b]]
+				while (v + 1)**3 <= P:
+					v += 1
+				while v**3 > P:
+					v -= 1
+		elif method == 2:
+			# 3/(1/r + 1/g + 1/b) is the ratio 3rgb/(gb + rb + rg), 0 with a black channel
+			D = g*b + r*b + r*g
+			v = 3*r*g*b//D if D else 0
+		elif method == 3:
+			v = min(r, g, b)
+		elif method == 4:
+			v = max(r, g, b)
+		elif method == 5:
+			v = (max(r, g, b) + min(r, g, b))//2
+		elif method == 6:
+			v = r + g + b - max(r, g, b) - min(r, g, b)
+		else:
+			v = (W[0]*r + W[1]*g + W[2]*b) >> BITS
+		out[p] = v
+
+#############
+# Grayscale #
+#############
+
+def _grayscale_float(img, method, weights):
+	# Float inputs, same definitions with black pixels handled
+	R, G, B = np.moveaxis(img, -1, 0)
+	if method == 'arithmetic':
+		return (R + G + B)/3
+	if method == 'geometric':
+		return np.cbrt(R*G*B)
+	if method == 'harmonic':
+		D = G*B + R*B + R*G
+		return np.divide(3*R*G*B, D, out=np.zeros_like(D), where=D != 0)
+	if method == 'minimum':
+		return img.min(axis=-1)
+	if method == 'maximum':
+		return img.max(axis=-1)
+	if method == 'lightness':
+		return (img.max(axis=-1) + img.min(axis=-1))/2
+	if method == 'median':
+		return R + G + B - img.max(axis=-1) - img.min(axis=-1)
+	w = np.asarray(weights, dtype=img.dtype)
+	return img @ (w/w.sum())
+
+@profile
+def grayscale(img, method='luminosity', weights=LUMINOSITY, out=None):
+	'''
+	Grayscale conversion of an RGB image or a batch of RGB images
+	img: Input (..., 3), uint8/uint16 in integer fixed-point arithmetic,
+	     other integer dtypes in float64
+	method: One of METHODS, integer results are truncated as the notebook
+	weights: Channel weights of the 'luminosity' method
+	out: Output array (...), the dtype of img by default
+	'''
+	img = np.asarray(img)
+	if img.ndim < 1 or img.shape[-1] != 3:
+		raise ValueError('Invalid argument! It is not a 3-channel image..')
+	if method not in METHODS:
+		raise ValueError(f'Invalid method! {method}')
+	if img.dtype.name not in INTEGERS:
+		if not np.issubdtype(img.dtype, np.floating):
+			# The weights and the harmonic mean need a float dtype
+			img = img.astype(np.float64)
+		gray = _grayscale_float(img, method, weights)
+		if out is None:
+			return gray
+		out[...] = gray
+		return out
+	if out is None:
+		out = np.empty(img.shape[:-1], dtype=img.dtype)
+	LOG, EXP = _log_tables(np.iinfo(img.dtype).max + 1)
+	# Contiguous views where possible, as the kernel signatures
+	flat = np.ascontiguousarray(out.reshape(-1))
+	_grayscale(np.ascontiguousarray(img.reshape(-1, 3)), METHODS.index(method), _fixed(weights), LOG, EXP, flat)
+	if not np.shares_memory(flat, out):
+		out[...] = flat.reshape(out.shape)
+	return out
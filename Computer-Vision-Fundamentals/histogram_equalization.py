@@ -0,0 +1,140 @@
+import numpy as np
+
+from color_models import rgb2hsv, hsv2rgb
+from profiling import profile
+
+###########
+# Helpers #
+###########
+
+def _channels(img):
+	# (N1, N2) or (N1, N2, C) -> (N1*N2, C)
+	return img.reshape(img.shape[0]*img.shape[1], -1)
+
+def _levels(dtype):
+	# Number of gray levels with a lookup table path
+	if dtype in (np.uint8, np.uint16):
+		return np.iinfo(dtype).max + 1
+	return None
+
+##########################
+# Histogram equalization #
+##########################
+
+def eqHist_LUT(img):
+	'''
+	Histogram equalization of uint8/uint16 images, all channels at once,
+	with a cumulative histogram and a lookup table
+	img: Input image (N1, N2) or (N1, N2, C)
+	'''
+	img = np.asarray(img)
+	L = _levels(img.dtype)
+	x = _channels(img)
+	N, C = x.shape
+	# One histogram per channel in a single bincount
+	index = x + L*np.arange(C, dtype=np.int64)
+	hist = np.bincount(index.ravel(), minlength=L*C).reshape(C, L)
+	# Number of pixels strictly lower than each level, as searchsorted
+	LUT = (np.cumsum(hist, axis=1) - hist)/(N - 1)
+	return LUT.ravel()[index].reshape(img.shape)
+
+def eqHist_rank(img):
+	'''
+	Histogram equalization of float images by the rank of every pixel
+	img: Input image (N1, N2) or (N1, N2, C)
+	'''
+	img = np.asarray(img)
+	x = _channels(img)
+	N, C = x.shape
+	# Sorting every channel at once
+	sort = np.sort(x, axis=0)
+	rank = np.empty(x.shape)
+	for c in range(C):
+		rank[:, c] = sort[:, c].searchsorted(x[:, c])
+	return (rank/(N - 1)).reshape(img.shape)
+
+@profile
+def eqHist(img):
+	'''
+	Histogram equalization of every channel, with a lookup table for
+	uint8/uint16 images and by rank for float images
+	img: Input image (N1, N2) or (N1, N2, C)
+	'''
+	img = np.asarray(img)
+	if img.ndim not in (2, 3):
+		raise ValueError('Invalid argument! It is not an image..')
+	if _levels(img.dtype):
+		return eqHist_LUT(img)
+	return eqHist_rank(img)
+
+@profile
+def eqHist3hsv(img, saturation=False):
+	'''
+	Histogram equalization of the value component, and optionally of the
+	saturation component, of a RGB image
+	'''
+	img = np.asarray(img)
+	L = _levels(img.dtype)
+	HSV = rgb2hsv(img/(L - 1) if L else img, dtype=np.float64)
+	if saturation:
+		HSV[..., 1] = eqHist(HSV[..., 1])
+	# Value of integer RGB is still an integer, max(R, G, B)
+	HSV[..., 2] = eqHist(img.max(axis=2) if L else HSV[..., 2])
+	return hsv2rgb(HSV, out=HSV)
+
+#########
+# CLAHE #
+#########
+
+def _interpolation(N, tiles):
+	# Neighbor tiles and bilinear weights between tile centers
+	f = (np.arange(N) + 0.5)*tiles/N - 0.5
+	i0 = np.clip(np.floor(f).astype(np.int64), 0, tiles - 1)
+	i1 = np.minimum(i0 + 1, tiles - 1)
+	w = np.clip(f - i0, 0, 1)
+	return i0, i1, w
+
+@profile
+def CLAHE(img, tiles=(8, 8), clip=2.0, bins=256, interval=[0, 1]):
+	'''
+	Contrast limited adaptive histogram equalization
+	img: Input image (N1, N2) or (N1, N2, C), channels equalized apart
+	tiles: Number of tiles along each axis
+	clip: Histogram clip limit, relative to a uniform histogram
+	bins: Gray levels of float images, integer images use their own
+	interval: Range of float images
+	'''
+	img = np.asarray(img)
+	if img.ndim not in (2, 3):
+		raise ValueError('Invalid argument! It is not an image..')
+	L = _levels(img.dtype)
+	if L:
+		x = img.astype(np.int64)
+	else:
+		L = bins
+		x = (img - interval[0])/(interval[1] - interval[0])
+		x = np.clip(np.rint(x*(L - 1)), 0, L - 1).astype(np.int64)
+	x = x.reshape(*img.shape[:2], -1)
+	N1, N2, C = x.shape
+	ty, tx = tiles
+	# Tile of every pixel
+	tile = (np.arange(N1)*ty//N1)[:, np.newaxis]*tx + np.arange(N2)*tx//N2
+	output = np.empty(x.shape)
+	for c in range(C):
+		index = tile*L + x[..., c]
+		hist = np.bincount(index.ravel(), minlength=ty*tx*L).reshape(ty*tx, L).astype(np.float64)
+		# Clip and redistribute the excess uniformly
+		count = hist.sum(axis=1, keepdims=True)
+		limit = np.maximum(clip*count/L, 1)
+		excess = np.maximum(hist - limit, 0).sum(axis=1, keepdims=True)
+		hist = np.minimum(hist, limit) + excess/L
+		LUT = (np.cumsum(hist, axis=1)/count).ravel()
+		# Bilinear blend between the four nearest tile lookup tables
+		i0, i1, wy = _interpolation(N1, ty)
+		j0, j1, wx = _interpolation(N2, tx)
+		v = x[..., c]
+		wy, wx = wy[:, np.newaxis], wx[np.newaxis]
+		top = (1 - wx)*LUT[(i0[:, np.newaxis]*tx + j0)*L + v] + wx*LUT[(i0[:, np.newaxis]*tx + j1)*L + v]
+		bottom = (1 - wx)*LUT[(i1[:, np.newaxis]*tx + j0)*L + v] + wx*LUT[(i1[:, np.newaxis]*tx + j1)*L + v]
+		output[..., c] = (1 - wy)*top + wy*bottom
+	return output.reshape(img.shape)
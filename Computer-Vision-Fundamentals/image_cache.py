@@ -0,0 +1,134 @@
+from collections import OrderedDict
+import glob
+import hashlib
+import os
+import tempfile
+import threading
+
+import imageio
+import numpy as np
+
+# Folder of the decoded .npy files, shared by every process on the machine
+CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'decoded_images'))
+
+# Bytes kept by the in-process cache, memory-mapped arrays count in full
+MAX_BYTES = 2**30
+
+# (path, mtime, size, dtype, decoder): read-only array, least recently used first
+_CACHE = OrderedDict()
+_LOCK = threading.Lock()
+
+#########
+# Tiers #
+#########
+
+def _decoder(read):
+	# Named functions by name, valid across processes, anonymous ones
+	# (lambdas, closures, partials) by identity, in process only
+	name = getattr(read, '__qualname__', None)
+	if name is None or '<' in name:
+		return read
+	return f'{read.__module__}.{name}'
+
+def _key(path, dtype, read):
+	path = os.path.realpath(path)
+	stat = os.stat(path)
+	# Every decoder keeps its own pixels
+	return path, stat.st_mtime_ns, stat.st_size, None if dtype is None else np.dtype(dtype).name, _decoder(read)
+
+def _file(key, cache_dir):
+	return os.path.join(cache_dir, hashlib.sha1(repr(key).encode()).hexdigest() + '.npy')
+
+def _load(key, cache_dir):
+	try:
+		return np.load(_file(key, cache_dir), mmap_mode='r')
+	except (OSError, ValueError):
+		return None
+
+def _store(key, x, cache_dir):
+	# Written aside and renamed, so concurrent workers never read a partial file
+	temp = None
+	try:
+		os.makedirs(cache_dir, exist_ok=True)
+		with tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.tmp', delete=False) as f:
+			temp = f.name
+			np.save(f, x)
+		os.replace(temp, _file(key, cache_dir))
+	except OSError:
+		return x
+	finally:
+		# Left behind only by a failed write, renamed otherwise
+		if temp is not None and os.path.exists(temp):
+			os.remove(temp)
+	stored = _load(key, cache_dir)
+	return x if stored is None else stored
+
+def _remember(key, x):
+	with _LOCK:
+		_CACHE[key] = x
+		_CACHE.move_to_end(key)
+		total = sum(v.nbytes for v in _CACHE.values())
+		while total > MAX_BYTES and len(_CACHE) > 1:
+			total -= _CACHE.popitem(last=False)[1].nbytes
+
+def _normalize(x, dtype):
+	# Integer levels to [0, 1] as the notebooks /255, floats only cast
+	if np.issubdtype(x.dtype, np.integer):
+		return np.divide(x, np.iinfo(x.dtype).max, dtype=dtype)
+	return x.astype(dtype)
+
+##########
+# Reader #
+##########
+
+def imread(path, dtype=None, cache_dir=CACHE_DIR, read=imageio.imread):
+	'''
+	Decoded image, cached in process and as a memory-mapped .npy file, keyed
+	by path, modification time, size, dtype and decoder
+	path: Image file
+	dtype: None keeps the decoded pixels, float32/float64 normalizes integer
+	       images to [0, 1] once and caches the result as its own variant
+	cache_dir: Folder of the .npy files, None for the in-process cache only
+	read: Decoder of a single file, i.e.: an EXR reader, anonymous decoders
+	      are cached in process only
+	Returns a read-only array, copy it before modifying
+	'''
+	key = _key(path, dtype, read)
+	if not isinstance(key[-1], str):
+		# No file name is valid for an anonymous decoder in other processes
+		cache_dir = None
+	with _LOCK:
+		if key in _CACHE:
+			_CACHE.move_to_end(key)
+			return _CACHE[key]
+	x = _load(key, cache_dir) if cache_dir else None
+	if x is None:
+		if dtype is None:
+			x = np.asarray(read(path))
+		else:
+			x = _normalize(imread(path, None, cache_dir, read), dtype)
+		if cache_dir:
+			x = _store(key, x, cache_dir)
+	if x.flags.writeable:
+		x.setflags(write=False)
+	_remember(key, x)
+	return x
+
+def imreadSequence(pathname, dtype=None, cache_dir=CACHE_DIR, read=imageio.imread):
+	'''
+	Decoded images of the files of a "glob" pattern, in sorted order
+	'''
+	for path in sorted(glob.glob(pathname)):
+		yield imread(path, dtype, cache_dir, read)
+
+def clear(disk=False, cache_dir=CACHE_DIR):
+	'''
+	Empty the in-process cache, and the .npy files of the folder with disk=True,
+	stray temporary files of interrupted writes included
+	'''
+	with _LOCK:
+		_CACHE.clear()
+	if disk and cache_dir:
+		for pattern in ('*.npy', '*.tmp'):
+			for path in glob.glob(os.path.join(cache_dir, pattern)):
+				os.remove(path)
@@ -0,0 +1,164 @@
+import importlib
+import time
+
+import numpy as np
+from numba import from_dtype, jit, prange, types
+
+# Input dtypes every image kernel is compiled for
+DTYPES = ('float32', 'float64', 'uint8')
+
+# Engines registering their kernels on import, loaded by warmup()
+MODULES = (
+	'convolution', 'box_filter', 'sobel_operator', 'radon_transform',
+	'connectedComponent_analysis', 'color_models', 'grayscale_conversion',
+	'auto_color_adjustment', 'compositing_operators'
+)
+
+############
+# Registry #
+############
+
+# name: (dispatcher, typed signatures, sample arguments)
+KERNELS = {}
+
+def register(name, signatures, sample):
+	'''
+	Register a lazily compiled dispatcher with its typed signatures, built
+	by warmup() or loaded from the on-disk cache of cache=True
+	signatures: Tuples of argument types, the calls must match them exactly
+	sample: Function returning small arguments of the first signature,
+	        for latency()
+	'''
+	def wrap(f):
+		KERNELS[name] = (f, signatures, sample)
+		return f
+	return wrap
+
+def array(dtype, ndim, layout='C', readonly=False):
+	'''
+	Array type of a signature
+	layout: 'C' for contiguous arrays, 'A' for strided views
+	readonly: For the write-protected tables cached by the engines
+	'''
+	return types.Array(from_dtype(np.dtype(dtype)), ndim, layout, readonly=readonly)
+
+###########
+# Kernels #
+###########
+
+@register('GCF', [(array(T, 1),)*2 for T in ('int64', 'int32', 'uint8')], lambda: (np.ones(16, dtype=np.int64),)*2)
+@jit(nopython=True, parallel=True, cache=True)
+def _GCF(x1, x2):
+	output = np.empty_like(x1)
+	for p in prange(x1.shape[0]):
+		a, b = x1[p], x2[p]
+		result = 1
+		for i in range(2, min(a, b) + 1):
+			if a % i == 0 and b % i == 0:
+				result = i
+		output[p] = result
+	return output
+
+@register('density', [(array('float64', 2), types.float64)], lambda: (np.zeros((16, 3)), 0.5))
+@jit(nopython=True, parallel=True, cache=True)
+def _density(P, r):
+	N = P.shape[0]
+	R = np.zeros(N)
+	D = (3*r*r)**0.5
+	# Every point gathers its own neighbors, so the rows are independent
+	for i in prange(N):
+		x, y, z = P[i, 0], P[i, 1], P[i, 2]
+		value = 0.0
+		for j in range(N):
+			if i == j:
+				continue
+			dx = abs(x - P[j, 0])
+			if dx > r:
+				continue
+			dy = abs(y - P[j, 1])
+			if dy > r:
+				continue
+			dz = abs(z - P[j, 2])
+			if dz > r:
+				continue
+			value += 1 - (dx**2 + dy**2 + dz**2)**0.5/D
+		R[i] = value
+	return R
+
+###########
+# Warm-up #
+###########
+
+def _load():
+	for module in MODULES:
+		importlib.import_module(module)
+
+def warmup(names=None):
+	'''
+	Compile, or load from the on-disk cache, every typed signature of the
+	kernels of the engines, so the first call does no work beyond the call
+	names: Kernel names, all of KERNELS by default
+	Returns the seconds spent on each kernel
+	'''
+	_load()
+	spent = {}
+	for name in KERNELS if names is None else names:
+		f, signatures, _ = KERNELS[name]
+		t0 = time.perf_counter()
+		for signature in signatures:
+			f.compile(signature)
+		spent[name] = time.perf_counter() - t0
+	return spent
+
+def latency(repeat=10):
+	'''
+	Cold-start and warm-call latency in seconds of every registered kernel
+	on small inputs, the cold call includes compiling or loading the cache
+	unless warmup() ran before
+	Returns {name: (cold, warm)} with the best warm call
+	'''
+	_load()
+	result = {}
+	for name, (f, signatures, sample) in KERNELS.items():
+		args = sample()
+		t0 = time.perf_counter()
+		f(*args)
+		cold = time.perf_counter() - t0
+		warm = np.inf
+		for _ in range(repeat):
+			t0 = time.perf_counter()
+			f(*args)
+			warm = min(warm, time.perf_counter() - t0)
+		result[name] = (cold, warm)
+	return result
+
+############
+# Wrappers #
+############
+
+def GCF(x1, x2):
+	'''
+	Greatest common factor of every pair of broadcast integers
+	'''
+	x1, x2 = np.broadcast_arrays(x1, x2)
+	dtype = np.result_type(x1, x2)
+	if dtype.name not in ('int64', 'int32', 'uint8'):
+		dtype = np.int64
+	flat = _GCF(np.ascontiguousarray(x1.ravel(), dtype=dtype), np.ascontiguousarray(x2.ravel(), dtype=dtype))
+	return flat.reshape(x1.shape)
+
+def density(P, r):
+	'''
+	Density of every 3D point, the sum of 1 - d/sqrt(3r^2) over the
+	neighbors within a cube of radius r
+	P: Points (N, 3)
+	'''
+	return _density(np.ascontiguousarray(P, dtype=np.float64), float(r))
+
+if __name__ == '__main__':
+	# The engines register into the imported module, not into __main__
+	import kernels
+	SUM = '{:>24s} {:>15s} {:>15s}'.format('kernel', 'cold ms', 'warm ms')
+	for name, (cold, warm) in kernels.latency().items():
+		SUM += '\n{:>24s} {:>15.3f} {:>15.3f}'.format(name, 1e3*cold, 1e3*warm)
+	print(SUM)
@@ -0,0 +1,213 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from functools import wraps
+
+import numpy as np
+
+# Off by default, a disabled hook is a single flag test
+_ENABLED = False
+_MEMORY = False
+
+# One dict per call: name, start, wall, cpu, self, bytes, peak, arrays,
+# depth, thread
+RECORDS = []
+
+_LOCAL = threading.local()
+_ORIGIN = time.perf_counter()
+
+###########
+# Control #
+###########
+
+def enable(memory=False):
+	'''
+	Start recording the instrumented calls
+	memory: Trace the bytes allocated by Python and numpy with tracemalloc,
+	        slower, and blind to allocations inside numba kernels
+	'''
+	global _ENABLED, _MEMORY
+	_ENABLED, _MEMORY = True, memory
+	if memory and not tracemalloc.is_tracing():
+		tracemalloc.start()
+
+def disable():
+	'''
+	Stop recording, the records are kept until clear()
+	'''
+	global _ENABLED, _MEMORY
+	if _MEMORY and tracemalloc.is_tracing():
+		tracemalloc.stop()
+	_ENABLED, _MEMORY = False, False
+
+def clear():
+	'''
+	Drop the records
+	'''
+	del RECORDS[:]
+
+def enabled():
+	'''
+	Recording state
+	'''
+	return _ENABLED
+
+#########
+# Hooks #
+#########
+
+def _arrays(args, kwargs):
+	# Shape and dtype of the array arguments
+	items = list(enumerate(args)) + list(kwargs.items())
+	return {str(k): f'{v.dtype}{list(v.shape)}' for k, v in items if isinstance(v, np.ndarray)}
+
+class _Frame:
+	__slots__ = ('name', 'arrays', 'start', 'cpu', 'child', 'current', 'peak')
+
+	def __init__(self, name, arrays):
+		self.name = name
+		self.arrays = arrays
+		self.child = 0.0
+		self.current = None
+
+	def enter(self):
+		stack = getattr(_LOCAL, 'stack', None)
+		if stack is None:
+			stack = _LOCAL.stack = []
+		if _MEMORY:
+			if stack:
+				# The parent keeps the peak so far, the child starts a new one
+				stack[-1].peak = max(stack[-1].peak, tracemalloc.get_traced_memory()[1])
+			tracemalloc.reset_peak()
+			self.current = self.peak = tracemalloc.get_traced_memory()[0]
+		stack.append(self)
+		self.cpu = time.process_time()
+		self.start = time.perf_counter()
+
+	def exit(self):
+		wall = time.perf_counter() - self.start
+		cpu = time.process_time() - self.cpu
+		stack = _LOCAL.stack
+		stack.pop()
+		record = {
+			'name': self.name, 'start': self.start - _ORIGIN, 'wall': wall, 'cpu': cpu,
+			'self': wall - self.child, 'bytes': None, 'peak': None, 'arrays': self.arrays,
+			'depth': len(stack), 'thread': threading.get_ident()
+		}
+		if self.current is not None and tracemalloc.is_tracing():
+			current, peak = tracemalloc.get_traced_memory()
+			self.peak = max(self.peak, peak)
+			record['bytes'] = current - self.current
+			record['peak'] = self.peak - self.current
+			if stack:
+				stack[-1].peak = max(stack[-1].peak, self.peak)
+			tracemalloc.reset_peak()
+		if stack:
+			stack[-1].child += wall
+		RECORDS.append(record)
+
+def profile(f=None, name=None):
+	'''
+	Decorator recording every call of a function while enabled
+	name: Stage name, the qualified function name by default
+	'''
+	if f is None:
+		return lambda f: profile(f, name)
+	label = name or f'{f.__module__}.{f.__qualname__}'
+
+	@wraps(f)
+	def wrapper(*args, **kwargs):
+		if not _ENABLED:
+			return f(*args, **kwargs)
+		frame = _Frame(label, _arrays(args, kwargs))
+		frame.enter()
+		try:
+			return f(*args, **kwargs)
+		finally:
+			frame.exit()
+
+	return wrapper
+
+class _Stage:
+	__slots__ = ('frame',)
+
+	def __init__(self, frame):
+		self.frame = frame
+
+	def __enter__(self):
+		if self.frame is not None:
+			self.frame.enter()
+		return self
+
+	def __exit__(self, *exc):
+		if self.frame is not None:
+			self.frame.exit()
+		return False
+
+_NULL = _Stage(None)
+
+def stage(name, **arrays):
+	'''
+	Context manager recording a block of code while enabled
+	arrays: Arrays whose shapes and dtypes are recorded
+	'''
+	if not _ENABLED:
+		return _NULL
+	return _Stage(_Frame(name, _arrays((), arrays)))
+
+##########
+# Report #
+##########
+
+def summary(records=None):
+	'''
+	Aggregate the records by stage, {name: {calls, wall, self, cpu, peak}}
+	in seconds and bytes, wall includes the nested stages and self does not
+	'''
+	result = {}
+	for r in RECORDS if records is None else records:
+		s = result.setdefault(r['name'], {'calls': 0, 'wall': 0.0, 'self': 0.0, 'cpu': 0.0, 'peak': None})
+		s['calls'] += 1
+		s['wall'] += r['wall']
+		s['self'] += r['self']
+		s['cpu'] += r['cpu']
+		if r['peak'] is not None:
+			s['peak'] = max(s['peak'] or 0, r['peak'])
+	return result
+
+def report(records=None):
+	'''
+	Print the per-stage summary, sorted by self time
+	'''
+	stages = summary(records)
+	total = sum(s['self'] for s in stages.values()) or 1
+	SUM = '{:>48s} {:>8s} {:>12s} {:>12s} {:>8s} {:>12s} {:>12s}'.format(
+		'stage', 'calls', 'wall s', 'self s', 'self %', 'cpu s', 'peak MiB')
+	for name, s in sorted(stages.items(), key=lambda item: -item[1]['self']):
+		peak = '' if s['peak'] is None else '{:.2f}'.format(s['peak']/2**20)
+		SUM += '\n{:>48s} {:>8d} {:>12.5f} {:>12.5f} {:>8.1f} {:>12.5f} {:>12s}'.format(
+			name[-48:], s['calls'], s['wall'], s['self'], 100*s['self']/total, s['cpu'], peak)
+	print(SUM)
+
+def export_json(path, records=None):
+	'''
+	Save the records and their per-stage summary as JSON
+	'''
+	records = RECORDS if records is None else records
+	with open(path, 'w') as f:
+		json.dump({'records': records, 'summary': summary(records)}, f, indent=1)
+
+def export_chrome(path, records=None):
+	'''
+	Save the records in the Chrome trace event format, for chrome://tracing
+	or https://ui.perfetto.dev
+	'''
+	events = [{
+		'name': r['name'], 'cat': r['name'].rsplit('.', 1)[0], 'ph': 'X',
+		'ts': r['start']*1e6, 'dur': r['wall']*1e6, 'pid': os.getpid(), 'tid': r['thread'],
+		'args': dict(r['arrays'], cpu=r['cpu'], bytes=r['bytes'], peak=r['peak'])
+	} for r in (RECORDS if records is None else records)]
+	with open(path, 'w') as f:
+		json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,300 @@
+from functools import lru_cache
+import time
+
+import numpy as np
+from numba import njit, jit, prange, types
+from scipy import ndimage, special
+
+from kernels import array, register
+from profiling import profile
+
+############
+# Geometry #
+############
+
+def angles(n_theta, theta_min=0, theta_max=360):
+	'''
+	Projection angles in degrees, in the order of the sinogram columns
+	'''
+	return np.linspace(theta_max*(1 - 1/n_theta), theta_min, n_theta)
+
+def back_angles(n_theta, theta_min=0, theta_max=360):
+	'''
+	Back-projection angles in degrees, as the notebook sinogram_i
+	'''
+	return np.linspace(theta_min*(1 - 1/n_theta), theta_max, n_theta)
+
+@lru_cache(maxsize=16)
+def geometry(shape, n_theta, theta_min=0, theta_max=360, back=False):
+	'''
+	Sampling geometry of every projection of a (N1, N2) image, rotated
+	about its center as scipy.ndimage.rotate(..., reshape=False) does
+	back: Use the back-projection angles instead
+	Returns the rotation (cos, sin), the offsets (n_theta, 2) and, for every
+	row of every rotated image, the columns [first, last) that may fall
+	inside the input (n_theta, N1, 2), so the kernels skip the samples outside
+	'''
+	N1, N2 = shape
+	thetas = (back_angles if back else angles)(n_theta, theta_min, theta_max)
+	# Exact at multiples of 90 degrees, as scipy
+	cos, sin = special.cosdg(thetas), special.sindg(thetas)
+	center = np.array([(N1 - 1)/2, (N2 - 1)/2])
+	offset = center - np.stack([cos*center[0] + sin*center[1], -sin*center[0] + cos*center[1]], axis=1)
+	# Input coordinates along the row i of the rotated image are a*j + b
+	i = np.arange(N1)
+	rays = np.empty((n_theta, N1, 2), dtype=np.int64)
+	lo = np.zeros((n_theta, N1))
+	hi = np.full((n_theta, N1), N2 - 1.0)
+	for a, b, n in ((sin, cos[:, np.newaxis]*i + offset[:, 0:1], N1), (cos, -sin[:, np.newaxis]*i + offset[:, 1:2], N2)):
+		a = a[:, np.newaxis]
+		with np.errstate(divide='ignore', invalid='ignore'):
+			t0, t1 = -b/a, (n - 1 - b)/a
+		flat = np.abs(a) < 1e-12
+		inside = (b >= -1e-9) & (b <= n - 1 + 1e-9)
+		lo = np.maximum(lo, np.where(flat, np.where(inside, 0, np.inf), np.minimum(t0, t1)))
+		hi = np.minimum(hi, np.where(flat, np.where(inside, N2 - 1, -np.inf), np.maximum(t0, t1)))
+	# One extra column on each side, the kernels check every sample exactly
+	empty = lo > hi
+	rays[..., 0] = np.where(empty, 0, np.clip(np.floor(np.where(empty, 0, lo)) - 1, 0, N2))
+	rays[..., 1] = np.where(empty, 0, np.clip(np.ceil(np.where(empty, 0, hi)) + 2, 0, N2))
+	for x in (cos, sin, offset, rays):
+		x.setflags(write=False)
+	return cos, sin, offset, rays
+
+###########
+# Kernels #
+###########
+
+@njit(cache=True)
+def _linear(coef, k, y, x):
+	# coef is padded by 2 on each side
+	i, j = int(np.floor(y)), int(np.floor(x))
+	u, v = y - i, x - j
+	i, j = i + 2, j + 2
+	return (1 - u)*((1 - v)*coef[k, i, j] + v*coef[k, i, j + 1]) + u*((1 - v)*coef[k, i + 1, j] + v*coef[k, i + 1, j + 1])
+
+@njit(cache=True)
+def _bspline(t):
+	# Cubic B-spline weights of the taps -1, 0, 1, 2 for a fraction t
+	t2 = t*t
+	t3 = t2*t
+	return (1 - t)**3/6, (3*t3 - 6*t2 + 4)/6, (-3*t3 + 3*t2 + 3*t + 1)/6, t3/6
+
+@njit(cache=True)
+def _cubic(coef, k, y, x):
+	# Cubic B-spline over the taps i - 1, ..., i + 2, coef is padded by 2
+	i, j = int(np.floor(y)), int(np.floor(x))
+	y0, y1, y2, y3 = _bspline(y - i)
+	x0, x1, x2, x3 = _bspline(x - j)
+	value = 0.0
+	for p, w in ((0, y0), (1, y1), (2, y2), (3, y3)):
+		row = coef[k, i + 1 + p]
+		value += w*(x0*row[j + 1] + x1*row[j + 2] + x2*row[j + 3] + x3*row[j + 4])
+	return value
+
+# cos, sin, offset and rays as cached by geometry(), then the order
+GEOMETRY = (
+	array('float64', 1, readonly=True), array('float64', 1, readonly=True),
+	array('float64', 2, readonly=True), array('int64', 3, readonly=True), types.int64
+)
+
+@register('project', [(array('float64', 3),) + GEOMETRY + (array('float64', 3),)],
+	lambda: (np.zeros((1, 20, 20)), *geometry((16, 16), 4), 3, np.zeros((1, 16, 4))))
+@jit(nopython=True, parallel=True, cache=True)
+def _project(coef, cos, sin, offset, rays, order, output):
+	K, N1, N2 = coef.shape[0], coef.shape[1] - 4, coef.shape[2] - 4
+	for e in prange(cos.shape[0]):
+		c, s = cos[e], sin[e]
+		for k in range(K):
+			acc = np.zeros(N2)
+			# Row by row of the rotated image, only over its span inside the input
+			for i in range(N1):
+				y0 = c*i + offset[e, 0]
+				x0 = -s*i + offset[e, 1]
+				for j in range(rays[e, i, 0], rays[e, i, 1]):
+					y = s*j + y0
+					x = c*j + x0
+					# Constant zero border, no interpolation beyond the edges
+					if y < 0 or y > N1 - 1 or x < 0 or x > N2 - 1:
+						continue
+					if order == 3:
+						acc[j] += _cubic(coef, k, y, x)
+					else:
+						acc[j] += _linear(coef, k, y, x)
+			output[k, :N2, e] = acc
+
+############
+# Sinogram #
+############
+
+def _coefficients(x, order, axes=(-2, -1)):
+	x = np.asarray(x, dtype=np.float64)
+	if order == 3:
+		# Prefilter once per image instead of once per angle
+		for axis in axes:
+			x = ndimage.spline_filter1d(x, 3, axis, mode='mirror')
+	elif order != 1:
+		raise ValueError(f'Invalid order! {order}')
+	pad = [(0, 0)]*x.ndim
+	for axis in axes:
+		pad[axis] = (2, 2)
+	# Mirror boundary of the spline, as scipy
+	return np.pad(x, pad, mode='reflect')
+
+@profile
+def sinogram(matrix, n_theta=18, theta_min=0, theta_max=360, order=3):
+	'''
+	Radon transform, sum of the image rotated by every angle along axis 0
+	matrix: Input matrix or stack of matrices (..., N1, N2)
+	n_theta: Number of axis inclinations
+	theta_min: Minimum angle
+	theta_max: Maximum angle
+	order: 3 for cubic splines, as scipy.ndimage.rotate, or 1 for bilinear
+	Returns (..., max(N1, N2), n_theta), the angles run from theta_max down
+	'''
+	matrix = np.asarray(matrix)
+	if matrix.ndim < 2:
+		raise ValueError('Invalid argument! It is not a matrix..')
+	*lead, N1, N2 = matrix.shape
+	cos, sin, offset, rays = geometry((N1, N2), n_theta, theta_min, theta_max)
+	coef = _coefficients(matrix, order).reshape(-1, N1 + 4, N2 + 4)
+	S = np.zeros((coef.shape[0], max(N1, N2), n_theta))
+	_project(coef, cos, sin, offset, rays, int(order), S)
+	return S.reshape(*lead, max(N1, N2), n_theta)
+
+###################
+# Back-projection #
+###################
+
+def ramlak(w):
+	return np.abs(w)
+
+def shepp_logan(w):
+	return np.abs(w)*np.sinc(w/2)
+
+def cosine(w):
+	return np.abs(w)*np.cos(np.pi*w/2)
+
+def hann(w):
+	return np.abs(w)*(1 + np.cos(np.pi*w))/2
+
+FILTERS = {
+	'ramlak': ramlak,
+	'shepp-logan': shepp_logan,
+	'cosine': cosine,
+	'hann': hann
+}
+
+@profile
+def filter_projections(S, filter_='ramlak'):
+	'''
+	Filter every projection (column) of a sinogram with one batched FFT
+	S: Sinogram (N, n_theta)
+	filter_: Name in FILTERS or a function f(w) of the centered frequency
+	         w in [-1, 1]
+	'''
+	S = np.asarray(S)
+	if isinstance(filter_, str) and filter_ not in FILTERS:
+		raise ValueError(f'Invalid filter! {filter_}')
+	f = FILTERS[filter_] if isinstance(filter_, str) else filter_
+	H = f(np.linspace(-1, 1, S.shape[0]))[:, np.newaxis]
+	# Same shifts as the notebook, so odd lengths filter alike
+	ST = np.fft.fftshift(np.fft.fft(S, axis=0), axes=0)
+	return np.fft.ifft(np.fft.fftshift(ST*H, axes=0), axis=0).real
+
+@njit(cache=True)
+def _cubic1d(coef, e, x):
+	# coef is padded by 2 on each side
+	j = int(np.floor(x))
+	x0, x1, x2, x3 = _bspline(x - j)
+	return x0*coef[e, j + 1] + x1*coef[e, j + 2] + x2*coef[e, j + 3] + x3*coef[e, j + 4]
+
+@njit(cache=True)
+def _linear1d(coef, e, x):
+	j = int(np.floor(x))
+	v = x - j
+	return (1 - v)*coef[e, j + 2] + v*coef[e, j + 3]
+
+@register('back_project', [(array('float64', 2),) + GEOMETRY + (array('float64', 2),)],
+	lambda: (np.zeros((4, 20)), *geometry((16, 16), 4, back=True), 3, np.zeros((16, 16))))
+@jit(nopython=True, parallel=True, cache=True)
+def _back_project(coef, cos, sin, offset, rays, order, output):
+	N1, N2 = output.shape
+	# Every row of the output is owned by one thread, all angles at once
+	for i in prange(N1):
+		for e in range(cos.shape[0]):
+			c, s = cos[e], sin[e]
+			y0 = c*i + offset[e, 0]
+			x0 = -s*i + offset[e, 1]
+			for j in range(rays[e, i, 0], rays[e, i, 1]):
+				y = s*j + y0
+				x = c*j + x0
+				if y < 0 or y > N1 - 1 or x < 0 or x > N2 - 1:
+					continue
+				# The smeared projection is constant along y, and so is its spline
+				if order == 3:
+					output[i, j] += _cubic1d(coef, e, x)
+				else:
+					output[i, j] += _linear1d(coef, e, x)
+
+@profile
+def sinogram_i(S, FBP=True, filter_='ramlak', theta_min=0, theta_max=360, order=3):
+	'''
+	Back projection of a sinogram, each projection is smeared across the
+	image and rotated back, without building the smeared images
+	S: Sinogram (N, n_theta)
+	FBP: Filtered back projection
+	filter_: Name in FILTERS or a function f(w), w in [-1, 1]
+	theta_min: Minimum angle
+	theta_max: Maximum angle
+	order: 3 for cubic splines, as scipy.ndimage.rotate, or 1 for linear
+	Returns the (N, N) reconstruction
+	'''
+	S = np.asarray(S, dtype=np.float64)
+	if S.ndim != 2:
+		raise ValueError('Invalid argument! It is not a sinogram..')
+	N, n_theta = S.shape
+	if FBP:
+		S = filter_projections(S, filter_)
+	# One row of coefficients per projection
+	coef = _coefficients(S.T, order, axes=(-1,))
+	cos, sin, offset, rays = geometry((N, N), n_theta, theta_min, theta_max, back=True)
+	Si = np.zeros((N, N))
+	_back_project(coef, cos, sin, offset, rays, int(order), Si)
+	return Si
+
+#############
+# Benchmark #
+#############
+
+def _sinogram_rotate(matrix, n_theta=18, theta_min=0, theta_max=360):
+	# Reference implementation from the notebook
+	N1, N2 = matrix.shape
+	S = np.zeros((n_theta, max(N1, N2)))
+	for e, theta in enumerate(angles(n_theta, theta_min, theta_max)):
+		rot = ndimage.rotate(matrix, theta, reshape=False)
+		S[e] = np.sum(rot, axis=0)
+	return S.T
+
+def benchmark(N=512, n_theta=1024):
+	'''
+	Print the time of the notebook sinogram against the precomputed one
+	N: Square image size
+	n_theta: Number of angles
+	'''
+	np.random.seed(1234)
+	x = np.random.random((N, N))
+	sinogram(x[:8, :8], 2)
+	SUM = '{:>10s} {:>15s} {:>15s}'.format('order', 'seconds', 'max error')
+	t0 = time.perf_counter()
+	S = _sinogram_rotate(x, n_theta)
+	SUM += '\n{:>10s} {:>15.4f} {:>15s}'.format('rotate', time.perf_counter() - t0, '')
+	for order in (3, 1):
+		geometry.cache_clear()
+		t0 = time.perf_counter()
+		Si = sinogram(x, n_theta, order=order)
+		SUM += '\n{:>10d} {:>15.4f} {:>15.2e}'.format(order, time.perf_counter() - t0, np.abs(Si - S).max())
+	print(SUM)
+
+if __name__ == '__main__':
+	benchmark()
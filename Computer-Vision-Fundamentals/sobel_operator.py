@@ -0,0 +1,135 @@
+import numpy as np
+from numba import jit, prange, types
+
+from border_padding import border_mode, resolve
+from kernels import DTYPES, array, register
+from profiling import profile
+
+OUTPUTS = ('gx', 'gy', 'magnitude', 'angle')
+
+###########
+# Kernels #
+###########
+
+def SobelFilters(radius):
+	'''
+	Separable factors of the Sobel operator of a given radius, the triangle
+	filter and the central difference
+	'''
+	size = 2*radius + 1
+	# Triangle filter
+	ht = np.arange(size) + 1
+	ht[size//2:] = ht[::-1][size//2:]
+	# Central difference
+	hc = np.arange(size)[::-1] - size//2
+	return ht, hc
+
+def SobelOp(radius, direction='x'):
+	'''
+	Sobel operator of a given radius as a 2D kernel
+	direction: 'x' or 'y'
+	'''
+	ht, hc = SobelFilters(radius)
+	if direction == 'y':
+		return np.outer(hc, ht)
+	return np.outer(ht, hc)
+
+###############
+# Filter bank #
+###############
+
+def _sample():
+	skip = np.empty((0, 0))
+	return np.zeros((16, 16), dtype=np.uint8), np.ones(3), np.ones(3), 1, 0.0, 64, True, False, np.empty((16, 16)), skip, skip, skip
+
+@register('sobel', [
+	(array(T, 2), array('float64', 1), array('float64', 1), types.int64, types.float64, types.int64, types.boolean, types.boolean)
+	+ (array(D, 2),)*4
+	for T in DTYPES for D in ('float32', 'float64')
+], _sample)
+@jit(nopython=True, parallel=True, cache=True)
+def _sobel(x, ht, hc, mode, cval, band, xpass, ypass, gx, gy, mag, ang):
+	# xpass: D and Gx, ypass: S and Gy, the other path is never run
+	N1, N2 = x.shape
+	size = ht.shape[0]
+	r = size//2
+	for t in prange((N1 + band - 1)//band):
+		a = t*band
+		b = min(a + band, N1)
+		# Row pass over the band and its halo, both factors from one read:
+		# D differentiates along the rows and S smooths along them
+		D = np.empty((b - a + 2*r, N2 if xpass else 0))
+		S = np.empty((b - a + 2*r, N2 if ypass else 0))
+		for u in range(b - a + 2*r):
+			i = resolve(a - r + u, N1, mode)
+			for n2 in range(N2):
+				d = 0.0
+				s = 0.0
+				if i >= 0 and r <= n2 < N2 - r:
+					for k in range(size):
+						v = x[i, n2 + k - r]
+						if xpass:
+							d += hc[k]*v
+						if ypass:
+							s += ht[k]*v
+				else:
+					for k in range(size):
+						j = resolve(n2 + k - r, N2, mode)
+						v = cval if i < 0 or j < 0 else x[i, j]
+						if xpass:
+							d += hc[k]*v
+						if ypass:
+							s += ht[k]*v
+				if xpass:
+					D[u, n2] = d
+				if ypass:
+					S[u, n2] = s
+		# Column pass, every requested output at once
+		for n1 in range(a, b):
+			for n2 in range(N2):
+				Gx = 0.0
+				Gy = 0.0
+				if xpass:
+					for k in range(size):
+						Gx += ht[k]*D[n1 - a + k, n2]
+				if ypass:
+					for k in range(size):
+						Gy += hc[k]*S[n1 - a + k, n2]
+				if gx.size:
+					gx[n1, n2] = Gx
+				if gy.size:
+					gy[n1, n2] = Gy
+				if mag.size:
+					mag[n1, n2] = (Gx*Gx + Gy*Gy)**0.5
+				if ang.size:
+					ang[n1, n2] = np.arctan2(Gy, Gx)
+
+@profile
+def sobel(img, radius=1, outputs=OUTPUTS, border='edge', cval=0.0, band=64, dtype=np.float64):
+	'''
+	Sobel filter bank, gradients, magnitude and direction in a single pass
+	over every neighborhood, through the separable structure of SobelOp
+	img: Input grayscale image
+	radius: Operator radius
+	outputs: Requested subset of OUTPUTS, the others are never computed
+	border: np.pad mode resolved on the fly, 'edge' as the notebook
+	cval: Border value for border='constant'
+	band: Rows per parallel band
+	Returns a dict with the requested outputs
+	'''
+	img = np.ascontiguousarray(img)
+	if img.ndim != 2:
+		raise ValueError('Invalid argument! It is not a grayscale image..')
+	if img.dtype.name not in DTYPES:
+		img = img.astype(np.float64)
+	for name in outputs:
+		if name not in OUTPUTS:
+			raise ValueError(f'Invalid output! {name}')
+	ht, hc = (h.astype(np.float64) for h in SobelFilters(radius))
+	result = {name: np.empty(img.shape, dtype=dtype) for name in outputs}
+	skip = np.empty((0, 0), dtype=dtype)
+	# Only the passes of the requested outputs, magnitude and angle need both
+	both = 'magnitude' in result or 'angle' in result
+	xpass, ypass = both or 'gx' in result, both or 'gy' in result
+	_sobel(img, ht, hc, border_mode(border), float(cval), int(band), xpass, ypass, *[result.get(name, skip) for name in OUTPUTS])
+	return result
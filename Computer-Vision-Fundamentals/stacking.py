@@ -0,0 +1,214 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import os
+import tempfile
+
+import imageio
+import numpy as np
+
+from profiling import profile
+
+############
+# Decoding #
+############
+
+def stackFiles(pathname):
+	'''
+	Frames matching a "glob" pattern, in sorted order
+	i.e.: "directory/sequence_folder/image_*.jpg"
+	'''
+	files = sorted(glob.glob(pathname))
+	if not files:
+		raise ValueError(f'Invalid argument! No file matches {pathname}')
+	return files
+
+def stackIter(pathname, workers=4, read=imageio.imread):
+	'''
+	Decode the frames of a "glob" pattern on a thread pool, in sorted order
+	and with a bounded number of frames in flight
+	workers: Number of decoding threads
+	read: Decoder of a single file
+	'''
+	files = stackFiles(pathname)
+	if not workers or workers < 2:
+		yield from map(read, files)
+		return
+	with ThreadPoolExecutor(workers) as pool:
+		pending = deque()
+		for FILE in files:
+			pending.append(pool.submit(read, FILE))
+			if len(pending) >= 2*workers:
+				yield pending.popleft().result()
+		while pending:
+			yield pending.popleft().result()
+
+@profile
+def stackRead(pathname, workers=4, out=None, read=imageio.imread):
+	'''
+	Stack of every frame of a "glob" pattern, (n, y, x, c)
+	pathname: i.e.: "directory/sequence_folder/image_*.jpg"
+	workers: Number of decoding threads
+	out: Output array or the path of a .npy file to be memory-mapped
+	read: Decoder of a single file
+	'''
+	n = len(stackFiles(pathname))
+	for index, frame in enumerate(stackIter(pathname, workers, read)):
+		if out is None:
+			out = np.zeros((n,) + frame.shape, dtype=frame.dtype)
+		elif isinstance(out, str):
+			out = np.lib.format.open_memmap(out, mode='w+', dtype=frame.dtype, shape=(n,) + frame.shape)
+		out[index] = frame
+	return out
+
+##########
+# Blends #
+##########
+
+MODES = (
+	'sum', 'arithmetic mean', 'geometric mean', 'harmonic mean', 'median',
+	'minimum', 'maximum', 'curtosis', 'variance', 'standard deviation'
+)
+
+def _frames(stack, axis, workers, read):
+	if isinstance(stack, str):
+		return stackIter(stack, workers, read)
+	if isinstance(stack, np.ndarray):
+		return iter(np.moveaxis(stack, axis, 0))
+	return iter(stack)
+
+def _fold(frames, modo):
+	# Online accumulators, memory proportional to one frame
+	n = 0
+	for frame in frames:
+		x = np.asarray(frame, dtype=np.float64)
+		if not n:
+			dtype = np.asarray(frame).dtype
+			if modo in ('minimum', 'maximum'):
+				acc = x.copy()
+			mean, M2, M3, M4 = [np.zeros(x.shape) for _ in range(4)]
+		n += 1
+		if modo in ('sum', 'arithmetic mean'):
+			mean += x
+		elif modo == 'geometric mean':
+			with np.errstate(divide='ignore'):
+				mean += np.log(x)
+		elif modo == 'harmonic mean':
+			with np.errstate(divide='ignore'):
+				mean += 1/x
+		elif modo == 'minimum':
+			np.minimum(acc, x, out=acc)
+		elif modo == 'maximum':
+			np.maximum(acc, x, out=acc)
+		else:
+			# Welford, extended to the fourth central moment for the kurtosis
+			delta = x - mean
+			delta_n = delta/n
+			term = delta*delta_n*(n - 1)
+			mean += delta_n
+			if modo == 'curtosis':
+				M4 += term*delta_n**2*(n*n - 3*n + 3) + 6*delta_n**2*M2 - 4*delta_n*M3
+				M3 += term*delta_n*(n - 2) - 3*delta_n*M2
+			M2 += term
+	if not n:
+		raise ValueError('Invalid argument! The stack is empty..')
+	if modo == 'sum':
+		blend = mean
+	elif modo == 'arithmetic mean':
+		blend = mean/n
+	elif modo == 'geometric mean':
+		blend = np.exp(mean/n)
+	elif modo == 'harmonic mean':
+		blend = n/mean
+	elif modo in ('minimum', 'maximum'):
+		blend = acc
+	elif modo == 'variance':
+		blend = M2/n
+	elif modo == 'standard deviation':
+		blend = (M2/n)**0.5
+	else:
+		# Fisher kurtosis, undefined where the frames do not vary
+		with np.errstate(divide='ignore', invalid='ignore'):
+			blend = np.where(M2 == 0, np.nan, n*M4/M2**2) - 3
+	return blend, dtype
+
+def _median_chunked(stack, chunk):
+	# Exact median, a band of rows of every frame at a time
+	blend = np.empty(stack.shape[1:])
+	for a in range(0, stack.shape[1], chunk):
+		blend[a:a + chunk] = np.median(stack[:, a:a + chunk], axis=0)
+	return blend
+
+def _remedian(frames, base):
+	# Median of medians of base frames, level by level
+	levels = []
+	dtype = None
+	for frame in frames:
+		x = np.asarray(frame)
+		if dtype is None:
+			dtype = x.dtype
+		level = 0
+		while True:
+			if level == len(levels):
+				levels.append([np.empty((base,) + x.shape), 0])
+			buffer = levels[level]
+			buffer[0][buffer[1]] = x
+			buffer[1] += 1
+			if buffer[1] < base:
+				break
+			x = np.median(buffer[0], axis=0)
+			buffer[1] = 0
+			level += 1
+	if dtype is None:
+		raise ValueError('Invalid argument! The stack is empty..')
+	# Weighted median of what is left, a level l value stands for base^l frames
+	values = np.concatenate([b[:k] for b, k in levels])
+	weights = np.concatenate([np.full(k, base**l) for l, (b, k) in enumerate(levels)])
+	order = np.argsort(values, axis=0)
+	cumulative = np.cumsum(weights[order], axis=0)
+	k = np.argmax(cumulative >= cumulative[-1]/2, axis=0)
+	blend = np.take_along_axis(np.take_along_axis(values, order, axis=0), k[np.newaxis], axis=0)[0]
+	return blend, dtype
+
+@profile
+def blendStack(stack, modo='median', axis=0, approx=False, base=7, chunk=64,
+		workers=4, read=imageio.imread):
+	'''
+	Statistical blend of a stack of frames, folded frame by frame
+	stack: Array (n, y, x, c), "glob" pattern or iterable of frames
+	modo: One of MODES
+	axis: Stacking axis of an array
+	approx: Approximate median in memory, a remedian of the given base,
+	        otherwise exact on a memory-mapped stack for patterns and
+	        iterables
+	chunk: Rows per band of the exact median
+	workers: Number of decoding threads for patterns
+	read: Decoder of a single file
+	'''
+	if modo not in MODES:
+		raise ValueError(f'Invalid mode! {modo}')
+	if modo != 'median':
+		blend, dtype = _fold(_frames(stack, axis, workers, read), modo)
+		return blend.astype(dtype)
+	if approx:
+		blend, dtype = _remedian(_frames(stack, axis, workers, read), base)
+		return blend.astype(dtype)
+	if isinstance(stack, np.ndarray):
+		stack = np.moveaxis(stack, axis, 0)
+		return _median_chunked(stack, chunk).astype(stack.dtype)
+	with tempfile.TemporaryDirectory() as folder:
+		path = os.path.join(folder, 'stack.raw')
+		# Frames are appended to disk as they come, the count may be unknown
+		n = 0
+		with open(path, 'wb') as f:
+			for frame in _frames(stack, axis, workers, read):
+				frame = np.ascontiguousarray(frame)
+				frame.tofile(f)
+				n += 1
+		if not n:
+			raise ValueError('Invalid argument! The stack is empty..')
+		stack = np.memmap(path, dtype=frame.dtype, mode='r', shape=(n,) + frame.shape)
+		blend = _median_chunked(stack, chunk).astype(frame.dtype)
+		# The mapping must be closed before the folder is removed
+		del stack
+	return blend
@@ -0,0 +1,13 @@
+import numpy as np
+import pytest
+
+from grayscale_conversion import METHODS, grayscale
+
+@pytest.mark.parametrize('dtype', [np.int32, np.int64])
+@pytest.mark.parametrize('method', METHODS)
+def test_wide_integers(dtype, method):
+	img = np.random.RandomState(1234).randint(0, 256, (8, 8, 3))
+	img[0, 0] = 0
+	gray = grayscale(img.astype(dtype), method)
+	assert not np.isnan(gray).any()
+	np.testing.assert_allclose(gray, grayscale(img.astype(np.float64), method))
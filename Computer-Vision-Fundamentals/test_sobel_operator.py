@@ -0,0 +1,27 @@
+import numpy as np
+
+from border_padding import border_mode
+from sobel_operator import SobelFilters, _sobel, sobel
+
+def _image():
+	return np.random.RandomState(1234).random_sample((40, 50))
+
+def test_single_gradient():
+	img = _image()
+	full = sobel(img)
+	for name in ('gx', 'gy'):
+		result = sobel(img, outputs=(name,))
+		assert list(result) == [name]
+		np.testing.assert_array_equal(result[name], full[name])
+
+def test_gx_skips_gy_path():
+	# With the y pass off, a gy buffer only receives the untouched zero Gy
+	img = _image()
+	ht, hc = (h.astype(np.float64) for h in SobelFilters(1))
+	gx, gy = np.empty(img.shape), np.full(img.shape, np.nan)
+	skip = np.empty((0, 0))
+	_sobel(img, ht, hc, border_mode('edge'), 0.0, 64, True, False, gx, gy, skip, skip)
+	full = sobel(img)
+	np.testing.assert_array_equal(gx, full['gx'])
+	np.testing.assert_array_equal(gy, 0)
+	assert (full['gy'] != 0).any()
@@ -0,0 +1,110 @@
+import numpy as np
+
+from border_padding import border_index
+from box_filter import box_sum, local_variance
+from convolution import convolve
+from profiling import profile
+
+#####################
+# Global thresholds #
+#####################
+
+@profile
+def otsu(img, bins=256):
+	'''
+	Otsu threshold, maximizing the between-class variance
+	img: Input grayscale image
+	bins: Number of histogram bins for non-uint8 images
+	'''
+	img = np.asarray(img)
+	if img.dtype == np.uint8:
+		# Exact histogram, one bin per gray level
+		hist = np.bincount(img.ravel(), minlength=256)
+		levels = np.arange(256)
+	else:
+		hist, edges = np.histogram(img, bins)
+		levels = (edges[:-1] + edges[1:])/2
+	p = hist/hist.sum()
+	omega = np.cumsum(p)
+	mu = np.cumsum(p*levels)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		sigma = (mu[-1]*omega - mu)**2/(omega*(1 - omega))
+	return levels[np.argmax(np.nan_to_num(sigma))]
+
+@profile
+def threshold(img, T=127):
+	'''
+	Global threshold, boolean output
+	img: Input grayscale image
+	T: Threshold value or 'otsu'
+	'''
+	img = np.asarray(img)
+	if isinstance(T, str):
+		if T != 'otsu':
+			raise ValueError(f'Invalid method! {T}')
+		T = otsu(img)
+	return img > T
+
+#######################
+# Adaptive thresholds #
+#######################
+
+METHODS = ('mean', 'gaussian', 'niblack', 'sauvola')
+
+def _gaussian(r):
+	# Same sigma rule as OpenCV for a (2r + 1) window
+	sigma = 0.3*(r - 1) + 0.8
+	g = np.exp(-np.arange(-r, r + 1)**2/(2*sigma**2))
+	return np.outer(g, g)/g.sum()**2
+
+def _local_threshold(x, r, method, C, k, R, border, cval):
+	if method == 'mean':
+		return box_sum(x, r, border, cval)/(2*r + 1)**2 - C
+	if method == 'gaussian':
+		return convolve(x, _gaussian(r), 'separable', border, cval) - C
+	mean, var = local_variance(x, r, border, cval)
+	if method == 'niblack':
+		return mean + k*var**0.5
+	return mean*(1 + k*(var**0.5/R - 1))
+
+@profile
+def adaptive_threshold(img, r=13, C=3, method='mean', k=None, R=None,
+		border='edge', cval=0, stripe=None, out=None):
+	'''
+	Adaptive threshold over the (2r + 1)^2 neighborhood of every pixel
+	img: Input grayscale image
+	C: Constant subtracted from the 'mean' and 'gaussian' thresholds
+	method: 'mean', 'gaussian', 'niblack' (mean + k*sigma)
+	        or 'sauvola' (mean*(1 + k*(sigma/R - 1)))
+	k: Niblack or Sauvola weight, -0.2 and 0.2 by default
+	R: Sauvola dynamic range of sigma, half the dtype range by default
+	border: np.pad mode resolved on the fly
+	cval: Border value for border='constant'
+	stripe: Process stripes of this many rows to bound the memory
+	out: Output array, e.g. a memory-mapped file
+	Output keeps the dtype of img, with values 0 and 1
+	'''
+	img = np.asarray(img)
+	if img.ndim != 2:
+		raise ValueError('Invalid argument! It is not a grayscale image..')
+	if method not in METHODS:
+		raise ValueError(f'Invalid method! {method}')
+	if k is None:
+		k = -0.2 if method == 'niblack' else 0.2
+	if R is None:
+		R = (np.iinfo(img.dtype).max + 1)/2 if np.issubdtype(img.dtype, np.integer) else 0.5
+	if out is None:
+		out = np.empty(img.shape, dtype=img.dtype)
+	N1 = img.shape[0]
+	if not stripe or stripe >= N1:
+		out[...] = img > _local_threshold(img, r, method, C, k, R, border, cval)
+		return out
+	for a in range(0, N1, stripe):
+		b = min(a + stripe, N1)
+		# Stripe with r halo rows on each side, borders resolved by row
+		rows = border_index(np.arange(a - r, b + r), N1, border)
+		block = img[rows]
+		block[rows < 0] = cval
+		T = _local_threshold(block, r, method, C, k, R, border, cval)
+		out[a:b] = img[a:b] > T[r:r + b - a]
+	return out
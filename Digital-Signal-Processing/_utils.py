@@ -4,28 +4,102 @@ import librosa
 import librosa.display
 import numpy as np
 
-def summary(x):
-	if x.ndim == 1:
-		SUM = ('\n{0:>10s}: {1:>15.4f}').format('min', np.amin(x))
-		SUM += ('\n{0:>10s}: {1:>15.4f}').format('1st Quar', np.percentile(x, 25))
-		SUM += ('\n{0:>10s}: {1:>15.4f}').format('median', np.median(x))
-		SUM += ('\n{0:>10s}: {1:>15.4f}').format('mean', np.mean(x))
-		SUM += ('\n{0:>10s}: {1:>15.4f}').format('3rd Quar', np.percentile(x, 75))
-		SUM += ('\n{0:>10s}: {1:>15.4f}').format('max', np.amax(x))
-		SUM += ('\n{0:>10s}: {1:>15.4f}').format('sigma', np.std(x))
-	elif x.ndim == 2:
-		E = x[:,0]
-		D = x[:,1]
-		SUM = ('{0:>%ss} {1:>%ss}' % (27, 15)).format('L', 'R')
-		SUM += ('\n{0:>10s}: {1:>15.4f} {2:>15.4f}').format('min', np.amin(E), np.amin(D))
-		SUM += ('\n{0:>10s}: {1:>15.4f} {2:>15.4f}').format('1st Quar', np.percentile(E, 25), np.percentile(D, 25))
-		SUM += ('\n{0:>10s}: {1:>15.4f} {2:>15.4f}').format('median', np.median(E), np.median(D))
-		SUM += ('\n{0:>10s}: {1:>15.4f} {2:>15.4f}').format('mean', np.mean(E), np.mean(D))
-		SUM += ('\n{0:>10s}: {1:>15.4f} {2:>15.4f}').format('3rd Quar', np.percentile(E, 75), np.percentile(D, 75))
-		SUM += ('\n{0:>10s}: {1:>15.4f} {2:>15.4f}').format('max', np.amax(E), np.amax(D))
-		SUM += ('\n{0:>10s}: {1:>15.4f} {2:>15.4f}').format('sigma', np.std(E), np.std(D))
-	else:
+# Names of the notebooks star import, the imports they relied on included
+__all__ = [
+	'plt', 'gridspec', 'librosa', 'np', 'summary', 'channel_stats', 'audiovis', 'spectrogram'
+]
+
+STATS = ['min', '1st Quar', 'median', 'mean', '3rd Quar', 'max', 'sigma']
+
+def _stats_exact(x):
+	# x is (samples, channels), every channel reduced at once
+	q1, median, q3 = np.percentile(x, [25, 50, 75], axis=0)
+	return {
+		'min': np.amin(x, axis=0),
+		'1st Quar': q1,
+		'median': median,
+		'mean': np.mean(x, axis=0),
+		'3rd Quar': q3,
+		'max': np.amax(x, axis=0),
+		'sigma': np.std(x, axis=0)
+	}
+
+def _stats_stream(blocks, sample, seed):
+	# Running extremes, Chan/Welford moments and a reservoir sample
+	rand = np.random.default_rng(seed)
+	n = 0
+	for block in blocks:
+		block = np.asarray(block, dtype=np.float64)
+		block = block.reshape(block.shape[0], -1)
+		nb = block.shape[0]
+		if not nb:
+			continue
+		mb = np.mean(block, axis=0)
+		M2b = np.sum((block - mb)**2, axis=0)
+		if not n:
+			vmin, vmax = np.amin(block, axis=0), np.amax(block, axis=0)
+			mean, M2 = mb, M2b
+			reservoir = np.empty((sample, block.shape[1]))
+		else:
+			vmin = np.minimum(vmin, np.amin(block, axis=0))
+			vmax = np.maximum(vmax, np.amax(block, axis=0))
+			delta = mb - mean
+			mean = mean + delta*nb/(n + nb)
+			M2 = M2 + M2b + delta**2*n*nb/(n + nb)
+		# Fill the reservoir, then replace with probability sample/index
+		fill = max(min(sample - n, nb), 0)
+		reservoir[n:n + fill] = block[:fill]
+		index = np.arange(n + fill, n + nb)
+		accept = rand.random(index.size) < sample/(index + 1)
+		reservoir[rand.integers(0, sample, accept.sum())] = block[fill:][accept]
+		n += nb
+	if not n:
+		raise ValueError('Invalid argument! There is no data..')
+	q1, median, q3 = np.percentile(reservoir[:min(n, sample)], [25, 50, 75], axis=0)
+	return {
+		'min': vmin,
+		'1st Quar': q1,
+		'median': median,
+		'mean': mean,
+		'3rd Quar': q3,
+		'max': vmax,
+		'sigma': (M2/n)**0.5
+	}
+
+def _blocks(x, chunk):
+	for i in range(0, x.shape[0], chunk):
+		yield x[i:i + chunk]
+
+def channel_stats(x, approx=False, sample=2**16, chunk=2**20, seed=1234):
+	'''
+	Summary statistics of every channel, with all quantiles from a single
+	partitioning pass
+	x: Mono or (samples, channels) audio, or an iterable of sample blocks
+	approx: Streaming mode over blocks of samples, the quantiles are
+	        approximated from a reservoir sample
+	sample: Reservoir size
+	chunk: Block size in samples for approx mode on arrays
+	Returns a dict of arrays with one value per channel
+	'''
+	if not hasattr(x, 'ndim'):
+		return _stats_stream(x, sample, seed)
+	if x.ndim not in (1, 2):
 		raise ValueError('Invalid argument! It is not an audio..')
+	x = x.reshape(x.shape[0], -1)
+	if approx:
+		return _stats_stream(_blocks(x, chunk), sample, seed)
+	return _stats_exact(x)
+
+def summary(x, **kwargs):
+	STAT = channel_stats(x, **kwargs)
+	C = STAT['min'].size
+	if C == 1:
+		SUM = ''
+	else:
+		names = 'LR' if C == 2 else [str(c) for c in range(C)]
+		SUM = ('{:>27s}' + ' {:>15s}'*(C - 1)).format(*names)
+	for name in STATS:
+		SUM += ('\n{:>10s}:' + ' {:>15.4f}'*C).format(name, *STAT[name])
 	print(SUM)
 
 def audiovis(x, fs=44100, **kwargs):